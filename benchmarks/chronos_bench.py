@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+"""
+Benchmarks for the hot paths of Chronos: loading events, laying them out,
+drawing the month view and navigating between months.
+
+Every size runs in its own process, so the reported peak memory belongs to
+that size only. The benchmarks needing GTK are skipped if it is not
+available.
+
+    python benchmarks/chronos_bench.py --sizes 1000,10000 --calendars 8
+"""
+
+import os
+import sys
+import time
+import argparse
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC)
+
+from fake_pim import FakeCalendar
+
+WIDTH = 800
+HEIGHT = 600
+
+
+def timed(function, repeat=3):
+    """Returns the best time of ``repeat`` calls to ``function``."""
+
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        function()
+        duration = time.time() - start
+        if best is None or duration < best:
+            best = duration
+    return best
+
+
+def bench_events(pim):
+
+    from chronos.event import Event
+
+    def construct():
+        for event in pim.events:
+            Event(color=(1, 0, 0), **event)
+
+    return [('construct events', timed(construct))]
+
+
+def bench_layout(pim):
+
+    from chronos.event import Event
+    from chronos.layout import LayoutEngine, iter_weeks
+    from datetime import date
+
+    events = [Event(color=(1, 0, 0), **e) for e in pim.events]
+    first = min(e.start_ordinal for e in events)
+    last = max(e.end_ordinal for e in events)
+    weeks = list(iter_weeks(first, last))
+    years = range(date.fromordinal(first).year, date.fromordinal(last).year + 1)
+
+    engine = LayoutEngine()
+
+    def add():
+        for event in events:
+            engine.add(event)
+
+    def layout():
+        engine.invalidate()
+        for week in weeks:
+            engine.week(week)
+
+    def update():
+        for event in events[:100]:
+            engine.update(event)
+        for week in weeks:
+            engine.week(week)
+
+    def toggle():
+        for visible in (False, True):
+            engine.set_visible(pim.calendars[0]['uid'], visible)
+            for week in weeks:
+                engine.week(week)
+
+    def occupancy():
+        engine._years.clear()
+        for year in years:
+            engine.year(year)
+
+    return [
+        ('index events', timed(add, 1)),
+        ('lay out {0} weeks'.format(len(weeks)), timed(layout)),
+        ('update 100 events', timed(update)),
+        ('toggle a calendar', timed(toggle)),
+        ('count events per day of {0} years'.format(len(years)), timed(occupancy)),
+    ]
+
+
+def bench_month_view(pim):
+
+    import cairo
+    from gi.repository import Gdk as gdk
+
+    from chronos.event import Event
+    from chronos.ui.month import MonthView
+    from chronos.utils import datetime
+
+    events = [Event(color=(.5, .6, .7), **e) for e in pim.events]
+
+    view = MonthView(datetime.now())
+    allocation = gdk.Rectangle()
+    allocation.x, allocation.y = 0, 0
+    allocation.width, allocation.height = WIDTH, HEIGHT
+    view.size_allocate(allocation)
+
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, WIDTH, HEIGHT)
+
+    def add():
+        view.add_events(events)
+
+    def draw():
+        view.draw(view, cairo.Context(surface))
+
+    def draw_static():
+        view.static_layers = None
+        draw()
+
+    def navigate():
+        date = view.date
+        for i in range(12):
+            date = date.next_month
+            view.set_date(date)
+            draw()
+        for i in range(12):
+            date = date.previous_month
+            view.set_date(date)
+            draw()
+
+    def navigate_prefetched():
+        date = view.date
+        for i in range(12):
+            date = date.next_month
+            view.set_date(date)
+            view.prefetch_cb()
+            draw()
+
+    results = [('add events to MonthView', timed(add, 1))]
+    draw_static()
+    results.extend([
+        ('draw, static layers rendered', timed(draw_static)),
+        ('draw, static layers cached', timed(draw)),
+        ('navigate 24 months', timed(navigate)),
+        ('navigate 12 months, prefetched', timed(navigate_prefetched, 1)),
+    ])
+    return results
+
+
+def bench_chronos(pim):
+
+    import imp
+    import shutil
+    import tempfile
+    import cairo
+    import cream.ipc
+    from gi.repository import Gdk as gdk
+
+    from chronos.snapshot import Snapshot
+
+    cream.ipc.get_object = lambda *args: pim
+
+    # chronos.py is shadowed by the chronos package, so load it by path
+    chronos_module = imp.load_source('chronos_main', os.path.join(SRC, 'chronos.py'))
+
+    directory = tempfile.mkdtemp()
+    snapshot = Snapshot(os.path.join(directory, 'snapshot.sqlite'))
+
+    results = []
+
+    def draw_frame(view):
+        """Renders one frame of ``view`` into an offscreen surface."""
+
+        allocation = gdk.Rectangle()
+        allocation.x, allocation.y = 0, 0
+        allocation.width, allocation.height = WIDTH, HEIGHT
+        view.size_allocate(allocation)
+
+        surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, WIDTH, HEIGHT)
+        view.draw(view, cairo.Context(surface))
+
+    def start(name):
+        """
+        Creates Chronos while holding back the replies of the PIM service,
+        then lets them through. Records the time until the month view has
+        drawn a frame with events and until all replies are handled.
+        """
+        pim.deferred = True
+
+        start = time.time()
+        chronos = chronos_module.Chronos(snapshot=snapshot)
+        if chronos.events:
+            draw_frame(chronos.calendar_ui.month_view)
+            results.append((name + ', first frame', time.time() - start))
+
+        pim.deliver()
+        results.append((name + ', loaded ({0} events)'.format(len(chronos.events)),
+                        time.time() - start))
+        return chronos
+
+    try:
+        chronos = start('cold start')
+        chronos.calendar_ui.window.destroy()
+
+        begin = time.time()
+        snapshot.save(chronos.sorted_calendars(), chronos.events.values())
+        results.append(('save snapshot', time.time() - begin))
+
+        chronos = start('warm start')
+
+        begin = time.time()
+        chronos.window_margin = None
+        chronos.loaded.ranges = []
+        chronos.load_window(chronos.calendar_ui.date)
+        results.append(('load all events', time.time() - begin))
+
+        chronos.calendar_ui.window.destroy()
+    finally:
+        shutil.rmtree(directory)
+
+    return results
+
+
+def run(size, calendars, gtk):
+
+    pim = FakeCalendar(size, calendars)
+
+    benchmarks = [bench_events, bench_layout]
+    if gtk:
+        benchmarks.extend([bench_month_view, bench_chronos])
+
+    results = []
+    for benchmark in benchmarks:
+        results.extend(benchmark(pim))
+    return results
+
+
+def run_in_child(size, calendars, gtk):
+    """
+    Runs the benchmarks for ``size`` events in a child process, returns
+    the results and the peak resident memory of the child in KiB.
+    """
+
+    read, write = os.pipe()
+    pid = os.fork()
+
+    if pid == 0:
+        os.close(read)
+        results = run(size, calendars, gtk)
+        os.write(write, repr(results))
+        os._exit(0)
+
+    os.close(write)
+    output = ''
+    while True:
+        data = os.read(read, 4096)
+        if not data:
+            break
+        output += data
+    os.close(read)
+
+    _, status, usage = os.wait4(pid, 0)
+    if status != 0:
+        raise RuntimeError('Benchmark for {0} events failed'.format(size))
+
+    return eval(output), usage.ru_maxrss
+
+
+def gtk_available():
+
+    try:
+        from gi.repository import Gtk
+        import cairo
+    except ImportError:
+        return False
+    return True
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='1000,5000,20000',
+                        help='comma separated numbers of events')
+    parser.add_argument('--calendars', type=int, default=8,
+                        help='number of calendars')
+    parser.add_argument('--no-gtk', action='store_true',
+                        help='only run the benchmarks not needing GTK')
+    args = parser.parse_args()
+
+    gtk = not args.no_gtk and gtk_available()
+    if not gtk:
+        print 'GTK is not available, skipping the view benchmarks'
+
+    for size in [int(s) for s in args.sizes.split(',')]:
+        results, peak = run_in_child(size, args.calendars, gtk)
+
+        print
+        print '{0} events in {1} calendars, peak memory {2:.1f} MiB'.format(
+                size, args.calendars, peak / 1024.0)
+        for name, duration in results:
+            print '    {0:<40} {1:>10.2f} ms'.format(name, duration * 1000)
+
+
+if __name__ == '__main__':
+    main()
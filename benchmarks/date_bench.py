@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+"""
+Microbenchmarks for the date helpers of ``chronos.utils``.
+
+    python benchmarks/date_bench.py --number 10000
+"""
+
+import os
+import sys
+import argparse
+import timeit
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC)
+
+SETUP = '''
+from chronos.utils import (datetime, days_in_month, iter_date_range,
+                           number_of_weeks, iter_month_dates, visible_dates)
+start = datetime(2011, 2, 1)
+end = datetime(2011, 3, 31)
+'''
+
+BENCHMARKS = [
+    ('days_in_month', 'days_in_month(2011, 2)'),
+    ('iter_date_range (59 days)', 'list(iter_date_range(start, end))'),
+    ('number_of_weeks', 'number_of_weeks(2011, 2)'),
+    ('iter_month_dates', 'list(iter_month_dates(2011, 2))'),
+    ('visible_dates', 'visible_dates(2011, 2)'),
+]
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--number', type=int, default=10000,
+                        help='calls per measurement')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='measurements, the best one is reported')
+    args = parser.parse_args()
+
+    for name, statement in BENCHMARKS:
+        best = min(timeit.repeat(statement, SETUP, repeat=args.repeat, number=args.number))
+        print '{0:<32} {1:>10.1f} us'.format(name, best / args.number * 1e6)
+
+
+if __name__ == '__main__':
+    main()
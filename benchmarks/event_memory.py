@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""
+Measures the memory taken and the time needed to construct events, and the
+time needed to access their datetimes afterwards.
+
+Every size runs in its own process, so the memory of one size does not
+distort the next.
+
+    python benchmarks/event_memory.py --sizes 10000,50000
+"""
+
+import os
+import sys
+import time
+import argparse
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC)
+
+from fake_pim import FakeCalendar
+
+
+def rss():
+    """Returns the resident memory of this process in KiB."""
+
+    with open('/proc/self/statm') as statm:
+        pages = int(statm.read().split()[1])
+    return pages * os.sysconf('SC_PAGE_SIZE') // 1024
+
+
+def measure(size):
+
+    from chronos.event import Event
+
+    pim = FakeCalendar(size, 4)
+
+    before = rss()
+    start = time.time()
+    events = [Event(color=(1, 0, 0), **e) for e in pim.events]
+    construct = time.time() - start
+    memory = rss() - before
+
+    start = time.time()
+    for event in events:
+        event.start, event.end
+    access = time.time() - start
+
+    return construct, memory, access, rss() - before
+
+
+def measure_in_child(size):
+
+    read, write = os.pipe()
+    pid = os.fork()
+
+    if pid == 0:
+        os.close(read)
+        os.write(write, repr(measure(size)))
+        os._exit(0)
+
+    os.close(write)
+    output = ''
+    while True:
+        data = os.read(read, 4096)
+        if not data:
+            break
+        output += data
+    os.close(read)
+
+    _, status = os.waitpid(pid, 0)
+    if status != 0:
+        raise RuntimeError('Measuring {0} events failed'.format(size))
+    return eval(output)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='10000,50000',
+                        help='comma separated numbers of events')
+    args = parser.parse_args()
+
+    for size in [int(s) for s in args.sizes.split(',')]:
+        construct, memory, access, total = measure_in_child(size)
+
+        print
+        print '{0} events'.format(size)
+        print '    {0:<32} {1:>10.2f} ms'.format('construct', construct * 1000)
+        print '    {0:<32} {1:>10.1f} MiB'.format('memory after construction', memory / 1024.0)
+        print '    {0:<32} {1:>10.2f} ms'.format('access start and end', access * 1000)
+        print '    {0:<32} {1:>10.1f} MiB'.format('memory after access', total / 1024.0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""
+A stand-in for the ``org.cream.PIM`` calendar object returned by
+``cream.ipc.get_object``, serving generated events.
+"""
+
+import time
+import random
+
+DAY = 24 * 60 * 60
+
+# (probability, minimum and maximum length in seconds, all day)
+LENGTHS = [
+    (.60, 30 * 60, 3 * 60 * 60, False), # meetings
+    (.25, DAY, DAY, True), # single all day events
+    (.10, 2 * DAY, 5 * DAY, True), # trips, conferences
+    (.05, 7 * DAY, 28 * DAY, True), # holidays
+]
+
+
+def generate_calendars(count):
+
+    calendars = []
+    for i in range(count):
+        calendars.append({
+            'uid': 'calendar-{0}'.format(i),
+            'name': 'Calendar {0}'.format(i),
+        })
+    return calendars
+
+
+def generate_events(count, calendars, days=730, seed=0):
+    """
+    Generates ``count`` events spread over ``days`` days around today and
+    across ``calendars``.
+    """
+
+    rnd = random.Random(seed)
+
+    today = time.mktime(time.localtime()[:3] + (0, 0, 0, 0, 0, -1))
+    first = today - days // 2 * DAY
+
+    events = []
+    for i in range(count):
+        p = rnd.random()
+        for probability, shortest, longest, all_day in LENGTHS:
+            if p < probability:
+                break
+            p -= probability
+
+        start = first + rnd.randrange(days) * DAY
+        if not all_day:
+            start += rnd.randrange(8, 19) * 60 * 60
+        length = rnd.randrange(shortest, longest + 1, all_day and DAY or 15 * 60)
+
+        events.append({
+            'uid': 'event-{0}'.format(i),
+            'title': 'Event {0} {1}'.format(i, 'x' * rnd.randrange(20)),
+            'description': '',
+            'start': start,
+            'end': start + length,
+            'location': None,
+            'calendar_uid': rnd.choice(calendars)['uid'],
+        })
+
+    return events
+
+
+class FakeCalendar(object):
+    """
+    Methods accept the ``reply_handler`` and ``error_handler`` keyword
+    arguments of asynchronous D-Bus calls. The reply is passed immediately,
+    or, if ``deferred`` is set, when ``deliver`` is called.
+    """
+
+    def __init__(self, events=1000, calendars=4, seed=0):
+
+        self.calendars = generate_calendars(calendars)
+        self.events = generate_events(events, self.calendars, seed=seed)
+        self.signals = {}
+        self.queries = 0
+
+        self.deferred = False
+        self.pending = []
+
+
+    def connect_to_signal(self, name, callback):
+        self.signals.setdefault(name, []).append(callback)
+
+    def emit(self, name, *args):
+        for callback in self.signals.get(name, []):
+            callback(*args)
+
+
+    def reply(self, result, kwargs):
+
+        if 'reply_handler' in kwargs:
+            if self.deferred:
+                self.pending.append((result, kwargs))
+            elif result is None:
+                kwargs['reply_handler']()
+            else:
+                kwargs['reply_handler'](result)
+        return result
+
+
+    def deliver(self):
+        """Passes all deferred replies, including those of calls they cause."""
+
+        self.deferred = False
+        while self.pending:
+            result, kwargs = self.pending.pop(0)
+            self.reply(result, kwargs)
+
+
+    def search_for_calendars(self, **kwargs):
+        return self.reply(None, kwargs)
+
+
+    def get_calendars(self, **kwargs):
+        return self.reply([dict(c) for c in self.calendars], kwargs)
+
+
+    def query(self, query, **kwargs):
+
+        self.queries += 1
+
+        events = self.events
+        if query.get('recurring'):
+            events = [e for e in events if e.get('rrule')]
+        if 'start' in query and 'end' in query:
+            events = [e for e in events
+                      if e['end'] >= query['start'] and e['start'] < query['end']]
+        return self.reply([dict(e) for e in events], kwargs)
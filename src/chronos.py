@@ -1,114 +1,623 @@
 #!/usr/bin/env python
 
+import time
+STARTED = time.time()
+
+import sys
+import sqlite3
+from bisect import bisect_left, insort
+from datetime import date
+
 from gi.repository import GObject as gobject
 
 import cream
 import cream.ipc
-import cream.util
-
-from cream.util.dicts import ordereddict
 
 from chronos.ui import CalendarUI
 from chronos.event import Event
+from chronos.changes import ChangeQueue, ADDED, UPDATED, REMOVED
+from chronos.snapshot import Snapshot
 
 from chronos.ui.utils import find_colors
+from chronos.utils import RangeSet, visible_dates
+from chronos.recurrence import expand
+from chronos.profiling import record, span, timed
+
+# Seconds to wait before asking for the calendars again after a failure,
+# doubled after every further failure up to the maximum
+RETRY_DELAY = 1
+MAX_RETRY_DELAY = 60
+
+# Number of days loaded before and after the visible weeks
+WINDOW_MARGIN = 31
+
+# Occurrences of recurring events are kept for this many days before and
+# after the range shown last
+EXPANSION_MARGIN = 366
 
 
 class Chronos(cream.Module):
 
-    def __init__(self):
+    def __init__(self, window_margin=WINDOW_MARGIN, snapshot=True):
+        """
+        If ``window_margin`` is ``None`` all events are loaded at startup,
+        otherwise only the events of the visible month and ``window_margin``
+        days around it are queried and further ones are fetched when the
+        date changes.
+
+        ``snapshot`` is a ``Snapshot`` to restore the last state from before
+        the PIM service replies, ``True`` for the default one or ``False``.
+        """
 
         cream.Module.__init__(self, 'org.cream.Chronos')
 
+        self.window_margin = window_margin
+        self.loaded = RangeSet()
+
         self.events = {}
-        self.calendars = ordereddict()
+        self.changes = ChangeQueue()
+        self._flush_source = None
+        self.calendars = {}
+        self.calendar_order = [] # (name, uid) pairs, sorted
         self.colors = find_colors(.57, .72, .79)
 
+        if snapshot is True:
+            snapshot = Snapshot()
+        self.snapshot = snapshot or None
+        # uids of events restored from the snapshot and not yet confirmed by
+        # the PIM service
+        self.unconfirmed = set()
+
+        # Occurrences of recurring events are only created for the ranges of
+        # days which have been shown, keyed by the uid of their series
+        self.expanded = RangeSet()
+        self.instances = {}
+        # Whether all recurring events have been queried, see ``load_series``
+        self.series_requested = False
+
         self.calendar = cream.ipc.get_object('org.cream.PIM', '/org/cream/PIM/Calendar')
-        self.calendar.search_for_calendars()
 
         self.calendar.connect_to_signal('calendar_added', self.add_calendar)
-        self.calendar.connect_to_signal('event_added', lambda u,e: self.add_events([e]))
-        self.calendar.connect_to_signal('event_removed', lambda u,e: self.remove_events([e]))
-        self.calendar.connect_to_signal('event_updated', lambda u,e: self.update_events([e]))
+        self.calendar.connect_to_signal('event_added', lambda u,e: self.queue_change(ADDED, e))
+        self.calendar.connect_to_signal('event_removed', lambda u,e: self.queue_change(REMOVED, e))
+        self.calendar.connect_to_signal('event_updated', lambda u,e: self.queue_change(UPDATED, e))
 
         self.calendar_ui = CalendarUI()
 
         self.calendar_ui.window.connect('delete_event', lambda *x: self.quit())
         self.calendar_ui.connect('calendar-state-changed', self.calendar_state_change_cb)
+        self.calendar_ui.connect('date-changed', lambda ui, day: self.load_window(day))
+        self.calendar_ui.connect('range-needed', lambda ui, first, last: self.load_range(first, last))
 
+        self._first_frame_handler = self.calendar_ui.month_view.connect_after(
+            'draw', self.first_frame_cb
+        )
 
-        for calendar in self.calendar.get_calendars():
-            self.add_calendar(calendar['uid'], calendar)
+        # Events can only be shown once their calendars are known
+        self.calendars_loaded = False
 
-        def add_events():
-            events = self.calendar.query({})
-            self.add_events(events)
-        gobject.timeout_add(1, add_events)
+        self.expanded.add(*self.window(self.calendar_ui.date))
 
+        if self.snapshot is not None:
+            self.restore_snapshot()
 
-    def add_events(self, events):
+        # Calendars found before are still loaded if the search fails
+        self.retry_delay = RETRY_DELAY
+        self.call_async('search_for_calendars', lambda *reply: self.load_calendars(),
+            error_callback=lambda error: self.load_calendars()
+        )
 
-        added_events = []
-        for event in events:
-            color = self.calendars[event['calendar_uid']]['color']
+
+    def first_frame_cb(self, view, ctx):
+        """Records the time from startup until the month view is drawn first."""
+
+        record('startup.first_frame', time.time() - STARTED)
+        view.disconnect(self._first_frame_handler)
+
+
+    def call_async(self, method, callback, *args, **kwargs):
+        """
+        Calls ``method`` of the PIM calendar without blocking the main loop.
+        ``callback`` is called with the reply and ``error_callback`` (if
+        given) with the error once it arrives.
+        """
+
+        error_callback = kwargs.pop('error_callback', None)
+        start = time.time()
+
+        def reply_handler(*reply):
+            record('ipc.' + method, time.time() - start)
+            callback(*reply)
+
+        def error_handler(error):
+            record('ipc.' + method, time.time() - start)
+            print >> sys.stderr, 'Calling {0} on the PIM service failed: {1}'.format(method, error)
+            if error_callback is not None:
+                error_callback(error)
+
+        getattr(self.calendar, method)(*args, reply_handler=reply_handler,
+                                       error_handler=error_handler)
+
+
+    def load_calendars(self):
+        """
+        Asks the PIM service for its calendars. Nothing can be loaded without
+        them, so the call is repeated with a growing delay until it succeeds.
+        """
+
+        self.call_async('get_calendars', self.calendars_loaded_cb,
+            error_callback=lambda error: self.retry_load_calendars()
+        )
+
+
+    def retry_load_calendars(self):
+
+        print >> sys.stderr, 'Asking for the calendars again in {0} seconds'.format(self.retry_delay)
+
+        def retry():
+            self.load_calendars()
+            return False
+
+        gobject.timeout_add_seconds(self.retry_delay, retry)
+        self.retry_delay = min(self.retry_delay * 2, MAX_RETRY_DELAY)
+
+
+    def restore_snapshot(self):
+        """
+        Shows the calendars and events of the snapshot. They are reconciled
+        with the PIM service as the visible ranges are queried.
+        """
+
+        with span('snapshot.load'):
+            calendars, events = self.snapshot.load()
+
+        self.add_calendars(calendars)
+
+        events = [e for e in events if e['calendar_uid'] in self.calendars]
+        self.add_events(events)
+        self.unconfirmed.update(e['uid'] for e in events)
+
+
+    def quit(self):
+
+        if self.snapshot is not None:
+            try:
+                with span('snapshot.save'):
+                    self.snapshot.save(self.sorted_calendars(), self.events.values())
+            except (EnvironmentError, sqlite3.Error) as error:
+                print >> sys.stderr, 'Saving the snapshot failed: {0}'.format(error)
+
+        cream.Module.quit(self)
+
+
+    def calendars_loaded_cb(self, calendars):
+        """
+        Shows ``calendars``, the calendars known to the PIM service. Those
+        restored from the snapshot are removed if they are not known anymore
+        and renamed if their name changed.
+        """
+
+        names = dict((calendar['uid'], calendar['name']) for calendar in calendars)
+
+        removed = [uid for uid in self.calendars if uid not in names]
+        if removed:
+            self.remove_calendars(removed)
+
+        for uid, calendar in self.calendars.iteritems():
+            if calendar['name'] != names[uid]:
+                self.calendar_order.remove((calendar['name'], uid))
+                calendar['name'] = names[uid]
+                insort(self.calendar_order, (calendar['name'], uid))
+
+        self.add_calendars(calendars)
+
+        self.calendars_loaded = True
+        self.load_window(self.calendar_ui.date)
+        if len(self.changes):
+            self.flush_changes()
+
+
+    def window(self, day):
+        """
+        Returns the ordinals of the first and the last day loaded around the
+        month of ``day``.
+        """
+
+        margin = WINDOW_MARGIN if self.window_margin is None else self.window_margin
+
+        first, last = visible_dates(day.year, day.month)
+        return first.toordinal() - margin, last.toordinal() + margin
+
+
+    def load_window(self, day):
+        """
+        Queries the events around the month of ``day`` which have not been
+        loaded yet. Ranges are marked as loaded when they are requested, so
+        a range is not requested twice while its reply is pending.
+        """
+
+        first, last = self.window(day)
+        self.expand_range(first, last)
+
+        if not self.calendars_loaded:
+            return
+
+        if self.window_margin is None:
+            if not self.loaded.ranges:
+                first, last = date.min.toordinal(), date.max.toordinal()
+                self.loaded.add(first, last)
+                self.call_async('query',
+                    lambda events: self.events_loaded_cb(events, first, last), {},
+                    error_callback=lambda error: self.loaded.remove(first, last)
+                )
+            return
+
+        self.load_series()
+        self.load_range(first, last)
+
+
+    def load_series(self):
+        """
+        Queries all recurring events once. A window only contains the series
+        whose first occurrence lies in it, so series starting earlier are
+        fetched separately.
+        """
+
+        if self.series_requested:
+            return
+        self.series_requested = True
+
+        first, last = date.min.toordinal(), date.max.toordinal()
+        self.call_async('query',
+            lambda events: self.events_loaded_cb(events, first, last, recurring=True),
+            {'recurring': True},
+            error_callback=lambda error: setattr(self, 'series_requested', False)
+        )
+
+
+    def load_range(self, first, last):
+        """
+        Queries the events between the ordinals ``first`` and ``last`` which
+        have not been loaded yet.
+        """
+
+        self.expand_range(first, last)
+
+        if not self.calendars_loaded:
+            return
+
+        for start, end in self.loaded.missing(first, last):
+            self.loaded.add(start, end)
+
+            query = {
+                'start': time.mktime(date.fromordinal(start).timetuple()),
+                'end': time.mktime(date.fromordinal(end + 1).timetuple())
+            }
+            self.call_async('query',
+                lambda events, s=start, e=end: self.events_loaded_cb(events, s, e, recurring=False),
+                query,
+                error_callback=lambda error, s=start, e=end: self.loaded.remove(s, e)
+            )
+
+
+    def expand_range(self, first, last):
+        """
+        Shows the occurrences of all recurring events between the ordinals
+        ``first`` and ``last`` which are not shown yet.
+        """
+
+        missing = list(self.expanded.missing(first, last))
+        if not missing:
+            return
+
+        instances = []
+        for start, end in missing:
+            self.expanded.add(start, end)
+            for uid in self.instances:
+                instances.extend(self.expand(self.events[uid], start, end))
+
+        if instances:
+            self.calendar_ui.add_events(instances)
+
+        self.evict_instances(first, last)
+
+
+    def evict_instances(self, first, last):
+        """
+        Forgets the occurrences of recurring events lying more than
+        ``EXPANSION_MARGIN`` days outside of the ordinals ``first`` to
+        ``last``. They are created again when their days are shown.
+        """
+
+        low, high = first - EXPANSION_MARGIN, last + EXPANSION_MARGIN
+
+        ranges = self.expanded.ranges
+        lowest, highest = ranges[0][0], ranges[-1][1]
+        if lowest >= low and highest <= high:
+            return
+
+        if lowest < low:
+            self.expanded.remove(lowest, low - 1)
+        if highest > high:
+            self.expanded.remove(high + 1, highest)
+
+        evicted = []
+        for instances in self.instances.itervalues():
+            for uid, instance in instances.items():
+                if instance.end_ordinal < low or instance.start_ordinal > high:
+                    evicted.append(instances.pop(uid))
+
+        if evicted:
+            self.calendar_ui.remove_events(evicted)
+
+
+    def expand(self, event, first, last):
+        """
+        Creates the occurrences of the recurring ``event`` between the
+        ordinals ``first`` and ``last`` and returns those not created before.
+        """
+
+        instances = self.instances.setdefault(event.uid, {})
+
+        created = []
+        for start, end in expand(event.rule, event.start_timestamp,
+                                 event.end_timestamp, first, last):
+            instance = event.instance(start, end)
+            if instance.uid not in instances:
+                instances[instance.uid] = instance
+                created.append(instance)
+        return created
+
+
+    def shown_events(self, event):
+        """Returns the events shown for ``event``, a stored event."""
+
+        if event.rule is None:
+            return [event]
+
+        shown = []
+        for first, last in self.expanded.ranges:
+            shown.extend(self.expand(event, first, last))
+        return shown
+
+
+    def hidden_events(self, event):
+        """
+        Returns the events shown for ``event`` and forgets the occurrences
+        of recurring events.
+        """
+
+        if event.rule is None:
+            return [event]
+        return self.instances.pop(event.uid, {}).values()
+
+
+    def events_loaded_cb(self, events, first, last, recurring=None):
+        """
+        Adds the events queried for the ordinals ``first`` to ``last``
+        and removes the events restored from the snapshot in this range
+        which the PIM service does not know anymore. If ``recurring`` is
+        ``True`` or ``False``, the reply only holds all recurring or all
+        other events of the range and only those are removed.
+        """
+
+        self.add_events(events)
+
+        if self.unconfirmed:
+            self.unconfirmed.difference_update(e['uid'] for e in events)
+
+            stale = []
+            for uid in self.unconfirmed:
+                event = self.events[uid]
+                if recurring is not None and (event.rule is not None) != recurring:
+                    continue
+                start, end = self.series_range(event)
+                if start <= last and end >= first:
+                    stale.append(uid)
+            if stale:
+                self.unconfirmed.difference_update(stale)
+                self.remove_events([{'uid': uid} for uid in stale])
+
+
+    def series_range(self, event):
+        """
+        Returns the ordinals of the first and the last day ``event`` or, for
+        a recurring event, any of its occurrences touches.
+        """
+
+        if event.rule is None:
+            return event.start_ordinal, event.end_ordinal
+
+        last = event.rule.last_day(event.start_timestamp, event.end_timestamp)
+        return event.start_ordinal, date.max.toordinal() if last is None else last
+
+
+    def queue_change(self, kind, event):
+        """
+        Queues a change reported by the PIM service. All changes arriving
+        before the main loop becomes idle are applied in one batch.
+        """
+
+        self.changes.push(kind, event)
+        if self._flush_source is None:
+            self._flush_source = gobject.idle_add(self.flush_changes)
+
+
+    def flush_changes(self):
+
+        self._flush_source = None
+
+        if not self.calendars_loaded:
+            # calendars_loaded_cb flushes the queue
+            return False
+
+        added, updated, removed = self.changes.flush()
+        if removed:
+            self.remove_events(removed)
+        if updated:
+            self.update_events(updated)
+        if added:
+            self.add_events(added)
+
+        return False
+
+
+    def make_event(self, event):
+        """
+        Returns an ``Event`` with the color of its calendar for ``event``,
+        a dictionary as sent by the PIM service, or ``None`` if the event
+        would not change the stored one.
+        """
+
+        color = self.calendars[event['calendar_uid']]['color']
+        try:
+            event = Event(color=color, **event)
+        except ValueError as error:
+            print >> sys.stderr, 'Showing only the first occurrence of {0}: {1}'.format(event['uid'], error)
+            event = dict(event, rrule=None)
             event = Event(color=color, **event)
 
+        stored = self.events.get(event.uid)
+        if stored is not None and stored == event and stored.color == color:
+            return None
+        return event
+
+
+    def store_events(self, events):
+        """
+        Stores ``events``, dictionaries as sent by the PIM service. Returns
+        the events to show and the events which are not shown anymore, e.g.
+        occurrences of a recurring event whose rule changed.
+        """
+
+        shown = []
+        hidden = []
+        for event in events:
+            if event['calendar_uid'] not in self.calendars:
+                continue
+            event = self.make_event(event)
+            if event is None:
+                continue
+
+            stored = self.events.get(event.uid)
             self.events[event.uid] = event
-            added_events.append(event)
 
-        self.calendar_ui.add_events(added_events)
+            if stored is not None:
+                hidden.extend(self.hidden_events(stored))
+            shown.extend(self.shown_events(event))
+
+        if hidden:
+            uids = set(e.uid for e in shown)
+            hidden = [e for e in hidden if e.uid not in uids]
 
+        return shown, hidden
 
+
+    @timed('chronos.add_events')
+    def add_events(self, events):
+
+        shown, hidden = self.store_events(events)
+
+        if hidden:
+            self.calendar_ui.remove_events(hidden)
+        if shown:
+            self.calendar_ui.add_events(shown)
+
+
+    @timed('chronos.remove_events')
     def remove_events(self, events):
 
         removed_events = []
         for event in events:
-            removed_events.append(self.events.pop(event.uid))
+            if event['uid'] in self.events:
+                removed_events.extend(self.hidden_events(self.events.pop(event['uid'])))
+                self.unconfirmed.discard(event['uid'])
 
-        self.calendar_ui.remove_events(removed_events)
+        if removed_events:
+            self.calendar_ui.remove_events(removed_events)
 
 
+    @timed('chronos.update_events')
     def update_events(self, events):
 
-        updated_events = []
-        for event in events:
-            event = Event(**event)
-            self.events[event.uid] = event
-            updated_events.append(event)
+        shown, hidden = self.store_events(events)
 
-        self.calendar_ui.update_events(updated_events)
+        if hidden:
+            self.calendar_ui.remove_events(hidden)
+        if shown:
+            self.calendar_ui.update_events(shown)
 
 
-    def add_calendar(self, uid, calendar):
+    def sorted_calendars(self):
+        return [self.calendars[uid] for name, uid in self.calendar_order]
+
 
-        color = self.colors.next()
+    def register_calendar(self, calendar):
+        """
+        Registers ``calendar`` and returns its position among all calendars
+        sorted by name, or ``None`` if it is known already.
+        """
 
-        calendar.update({'color': color, 'active': True})
+        if calendar['uid'] in self.calendars:
+            return None
+
+        # Calendars from the snapshot keep their color and visibility
+        if 'color' in calendar:
+            calendar['color'] = tuple(calendar['color'])
+        else:
+            calendar['color'] = self.colors.next()
+        calendar.setdefault('active', True)
         self.calendars[calendar['uid']] = calendar
 
-        new = ordereddict()
-        for key in sorted(self.calendars, key=lambda k: self.calendars[k]['name']):
-            new[key] = self.calendars[key]
+        if not calendar['active']:
+            self.calendar_ui.set_calendar_visible(calendar['uid'], False)
+
+        key = (calendar['name'], calendar['uid'])
+        position = bisect_left(self.calendar_order, key)
+        self.calendar_order.insert(position, key)
+
+        return position
+
+
+    def add_calendar(self, uid, calendar):
+
+        position = self.register_calendar(calendar)
+        if position is not None:
+            self.calendar_ui.add_calendar(calendar, position)
+
+
+    def add_calendars(self, calendars):
+        """Registers ``calendars`` and updates the tag bar once."""
+
+        for calendar in calendars:
+            self.register_calendar(calendar)
 
-        self.calendars = new
+        self.calendar_ui.set_calendars(self.sorted_calendars())
 
-        self.calendar_ui.set_calendars(self.calendars.values())
+
+    def remove_calendars(self, uids):
+        """
+        Forgets the calendars ``uids`` and removes their events. Their tags
+        are removed with the next call to ``add_calendars``.
+        """
+
+        uids = set(uids)
+        self.remove_events([{'uid': event.uid} for event in self.events.itervalues()
+                            if event.calendar_uid in uids])
+
+        for uid in uids:
+            calendar = self.calendars.pop(uid)
+            self.calendar_order.remove((calendar['name'], uid))
 
 
     def calendar_state_change_cb(self, ui, uid, state):
 
         self.calendars[uid]['active'] = state
-        updated_events = []
-        for event in self.events.itervalues():
-            if event.calendar_uid == uid:
-                event.active = state
-                updated_events.append(event)
-
-        self.calendar_ui.update_events(updated_events)
+        self.calendar_ui.set_calendar_visible(uid, state)
 
 
 if __name__ == '__main__':
+    import cream.util
     cream.util.set_process_name('chronos')
     chronos = Chronos()
     chronos.main()
@@ -0,0 +1,64 @@
+from cream.util.dicts import ordereddict
+
+ADDED = 'added'
+UPDATED = 'updated'
+REMOVED = 'removed'
+
+
+class ChangeQueue(object):
+    """
+    Collects event changes reported by the PIM service so they can be applied
+    in one batch. Changes to the same event are merged, e.g. an event which is
+    added and then removed again before the queue is flushed is dropped.
+    """
+
+    def __init__(self):
+
+        self._changes = ordereddict()
+
+
+    def __len__(self):
+        return len(self._changes)
+
+
+    def push(self, kind, event):
+
+        uid = event['uid']
+
+        if uid not in self._changes:
+            self._changes[uid] = (kind, event)
+            return
+
+        previous = self._changes[uid][0]
+
+        if previous == ADDED:
+            if kind == REMOVED:
+                del self._changes[uid]
+            else:
+                self._changes[uid] = (ADDED, event)
+        elif previous == UPDATED:
+            if kind == REMOVED:
+                self._changes[uid] = (REMOVED, event)
+            else:
+                self._changes[uid] = (UPDATED, event)
+        elif previous == REMOVED:
+            if kind == REMOVED:
+                self._changes[uid] = (REMOVED, event)
+            else:
+                # removed and added again, so we only need to update it
+                self._changes[uid] = (UPDATED, event)
+
+
+    def flush(self):
+        """
+        Returns the pending changes as a tuple of lists of added, updated and
+        removed events and empties the queue.
+        """
+
+        changes = {ADDED: [], UPDATED: [], REMOVED: []}
+        for kind, event in self._changes.itervalues():
+            changes[kind].append(event)
+
+        self._changes = ordereddict()
+
+        return changes[ADDED], changes[UPDATED], changes[REMOVED]
@@ -1,43 +1,108 @@
+import time
+import datetime as _datetime
+
 from chronos.utils import datetime
-from datetime import timedelta
+from chronos.recurrence import Rule
+
+
+def to_timestamp(value):
+    """Returns ``value``, a timestamp or a datetime, as a timestamp."""
+
+    if isinstance(value, (float, int, long)):
+        return float(value)
+
+    return time.mktime(value.timetuple()) + value.microsecond / 1e6
+
+
+def to_ordinal(t):
+    """Returns the ordinal of the day of the ``time.struct_time`` ``t``."""
+    return _datetime.date(t.tm_year, t.tm_mon, t.tm_mday).toordinal()
+
 
 class Event(object):
-    """An internal representation of an event."""
+    """
+    An internal representation of an event.
+
+    Start and end are stored as timestamps together with the ordinals of the
+    days they fall on. The ``start`` and ``end`` datetimes are only created
+    when they are accessed.
+
+    A recurring event has a ``rule``, built from ``rrule`` and ``exdates``,
+    and its start and end are those of the first occurrence. The events
+    shown for the occurrences are created with ``instance`` and carry the
+    uid of the series as ``recurrence_uid``.
+    """
+
+    __slots__ = ('uid', 'title', 'description', 'location', 'calendar_uid',
+                 'color', 'start_timestamp', 'end_timestamp',
+                 'start_ordinal', 'end_ordinal', '_start', '_end', 'rule',
+                 'recurrence_uid')
 
     def __init__(self, uid, title='', description='', start=None, end=None,
-                       location=None, calendar_uid='', color=None, active=True):
+                       location=None, calendar_uid='', color=None,
+                       rrule=None, exdates=(), recurrence_uid=None):
 
         self.uid = uid
         self.title = title
         self.description = description
-        self.start = start
-        self.end = end
         self.location = location
         self.calendar_uid = calendar_uid
         self.color = color
-        self.active = active
+        self.rule = Rule.parse(rrule, exdates or ()) if rrule else None
+        self.recurrence_uid = recurrence_uid
 
-        if isinstance(start, (float, int)):
-            self.start = datetime.fromtimestamp(start)
-        if isinstance(end, (float, int)):
-            self.end = datetime.fromtimestamp(end)
+        self.start_timestamp = to_timestamp(start)
+        self.end_timestamp = to_timestamp(end)
+        self._start = None
+        self._end = None
 
-        if (self.end.day - self.start.day == 1 and self.end.hour == 0 and
-            self.end.minute == 0 and self.end.second == 0):
+        start = time.localtime(self.start_timestamp)
+        end = time.localtime(self.end_timestamp)
+
+        if (end.tm_mday - start.tm_mday == 1 and end.tm_hour == 0 and
+            end.tm_min == 0 and end.tm_sec == 0):
             # This is a single day event but actually spawns over 2 days
-            prev = self.end - timedelta(seconds=1)
-            self.end = datetime.from_datetime(prev)
+            self.end_timestamp -= 1
+            end = time.localtime(self.end_timestamp)
+
+        self.start_ordinal = to_ordinal(start)
+        self.end_ordinal = to_ordinal(end)
+
+
+    @property
+    def start(self):
+
+        if self._start is None:
+            self._start = datetime.fromtimestamp(self.start_timestamp)
+        return self._start
+
+    @property
+    def end(self):
+
+        if self._end is None:
+            self._end = datetime.fromtimestamp(self.end_timestamp)
+        return self._end
+
+
+    def instance(self, start, end):
+        """Returns the occurrence of this recurring event at ``start``."""
+
+        return Event('{0}/{1}'.format(self.uid, int(start)), self.title,
+                      self.description, start, end, self.location,
+                      self.calendar_uid, self.color,
+                      recurrence_uid=self.uid)
+
 
     def __eq__(self, other):
 
         if (self.uid == other.uid and
            self.title == other.title and
            self.description == other.description and
-           self.start == other.start and
-           self.end == other.end and
+           self.start_timestamp == other.start_timestamp and
+           self.end_timestamp == other.end_timestamp and
            self.location == other.location and
            self.calendar_uid == other.calendar_uid and
-           self.active == other.active):
+           self.rule == other.rule):
             return True
         else:
             return False
@@ -0,0 +1,106 @@
+from bisect import bisect_left, bisect_right, insort
+
+
+def event_span(event):
+    """
+    Returns the ordinals of the first and the last day ``event`` touches.
+    """
+    return event.start_ordinal, event.end_ordinal
+
+
+def group(start, end):
+    """Returns the group of an event, the bit length of its length in days."""
+    return (end - start).bit_length()
+
+
+class EventIndex(object):
+    """
+    An interval index over events.
+
+    Events are grouped by their length, with every group holding events
+    less than twice as long as the shortest one could be. Within a group
+    they are kept sorted by the ordinal of the day they start on. As an event
+    can only touch a given day if it starts at most its length earlier, a
+    lookup is a bisection per group followed by a scan over the events
+    starting in that window, so a few long events do not slow down lookups
+    among the many short ones.
+    """
+
+    def __init__(self):
+
+        self._events = {}
+        self._spans = {}
+        self._groups = {} # bit length of the event length -> sorted (start, uid) pairs
+
+
+    def __len__(self):
+        return len(self._events)
+
+    def __contains__(self, uid):
+        return uid in self._events
+
+    def __iter__(self):
+        return self._events.itervalues()
+
+
+    def get(self, uid):
+        return self._events.get(uid)
+
+
+    def add(self, event):
+
+        if event.uid in self._events:
+            self.remove(event)
+
+        start, end = event_span(event)
+
+        self._events[event.uid] = event
+        self._spans[event.uid] = (start, end)
+        insort(self._groups.setdefault(group(start, end), []), (start, event.uid))
+
+
+    def remove(self, event):
+
+        uid = event.uid
+        start, end = self._spans.pop(uid)
+        del self._events[uid]
+
+        starts = self._groups[group(start, end)]
+        del starts[bisect_left(starts, (start, uid))]
+        if not starts:
+            del self._groups[group(start, end)]
+
+
+    def span(self, uid):
+        """Returns the first and last day ordinal of the event with ``uid``."""
+        return self._spans[uid]
+
+
+    def query(self, first, last):
+        """
+        Returns all events touching at least one day between the ordinals
+        ``first`` and ``last`` (inclusive).
+        """
+
+        spans = self._spans
+        events = self._events
+
+        result = []
+        for bits, starts in self._groups.iteritems():
+            longest = (1 << bits) - 1
+            lo = bisect_left(starts, (first - longest,))
+            hi = bisect_right(starts, (last + 1,))
+            result.extend(events[uid] for _, uid in starts[lo:hi]
+                          if spans[uid][1] >= first)
+        return result
+
+
+    def between(self, start, end):
+        """Returns all events touching a day between ``start`` and ``end``."""
+        return self.query(start.toordinal(), end.toordinal())
+
+
+    def on(self, date):
+        """Returns all events touching ``date``."""
+        ordinal = date.toordinal()
+        return self.query(ordinal, ordinal)
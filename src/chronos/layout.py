@@ -0,0 +1,397 @@
+import time
+import datetime
+from heapq import heappush, heappop
+from bisect import bisect_left
+
+from chronos.index import EventIndex, event_span
+from chronos.occupancy import year_bounds, count_days, add_span, add_counts
+
+# Timed events are at least this long (in seconds) in a day layout, so
+# events without a duration stay visible
+MIN_DURATION = 15 * 60
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def week_start(ordinal):
+    """Returns the ordinal of the monday of the week containing ``ordinal``."""
+    return ordinal - (ordinal + 6) % 7
+
+
+def iter_weeks(first, last):
+    """
+    Yields the ordinals of the mondays of all weeks between the ordinals
+    ``first`` and ``last``.
+    """
+    week = week_start(first)
+    while week <= last:
+        yield week
+        week += 7
+
+
+class WeekLayout(object):
+    """
+    The lane assignment for one week.
+
+    ``segments`` holds ``(event, lane, first, last)`` tuples where ``first``
+    and ``last`` are the ordinals of the days the event covers in this week.
+    """
+
+    def __init__(self, week, segments):
+
+        self.week = week
+        self.segments = segments
+        self.lanes = max([s[1] for s in segments]) + 1 if segments else 0
+
+        self.days = {}
+        for day in range(week, week + 7):
+            self.days[day] = []
+        for segment in segments:
+            for day in range(segment[2], segment[3] + 1):
+                self.days[day].append(segment[:2])
+
+        for day in self.days.itervalues():
+            day.sort(key=lambda s: s[1])
+
+
+    def on(self, ordinal):
+        """Returns a list of ``(event, lane)`` pairs for the given day."""
+        return self.days[ordinal]
+
+
+def pack_week(week, events):
+    """
+    Assigns lanes to the segments of ``events`` falling into ``week``.
+
+    Longer segments are placed first, equally long ones are ordered by their
+    title. Every segment goes into the lowest lane which is free on all of
+    its days.
+    """
+
+    segments = []
+    for event in events:
+        start, end = event_span(event)
+        first = max(start, week)
+        last = min(end, week + 6)
+        if first <= last:
+            segments.append((event, first, last))
+
+    segments.sort(key=lambda s: (s[1] - s[2], s[0].title, s[0].uid))
+
+    lanes = [] # a bitmask of occupied days for every lane
+    packed = []
+    for event, first, last in segments:
+        mask = ((1 << (last - first + 1)) - 1) << (first - week)
+        for lane, occupied in enumerate(lanes):
+            if not occupied & mask:
+                lanes[lane] |= mask
+                break
+        else:
+            lane = len(lanes)
+            lanes.append(mask)
+        packed.append((event, lane, first, last))
+
+    return WeekLayout(week, packed)
+
+
+def pack_columns(intervals):
+    """
+    Assigns columns to ``intervals``, ``(start, end, item)`` tuples, with a
+    sweep over their start points: every interval goes into the lowest
+    column which is free at its start. Returns ``(item, start, end, column,
+    columns)`` tuples sorted by start, where ``columns`` is the number of
+    columns used by the group of overlapping intervals the item belongs to.
+    """
+
+    intervals = sorted(intervals, key=lambda i: (i[0], i[1]))
+
+    packed = []
+    groups = [] # number of columns per group
+    active = [] # heap of (end, column) of the running intervals
+    free = [] # heap of columns freed within the current group
+
+    for start, end, item in intervals:
+        while active and active[0][0] <= start:
+            heappush(free, heappop(active)[1])
+
+        if not active:
+            # Nothing overlaps anymore, so a new group starts
+            groups.append(0)
+            free = []
+
+        if free:
+            column = heappop(free)
+        else:
+            column = groups[-1]
+            groups[-1] += 1
+
+        heappush(active, (end, column))
+        packed.append((item, start, end, column, len(groups) - 1))
+
+    return [(item, start, end, column, groups[group])
+            for item, start, end, column, group in packed]
+
+
+class DayLayout(object):
+    """
+    The events of one day. ``all_day`` holds the events covering the whole
+    day, ``timed`` holds ``(event, start, end, column, columns)`` tuples as
+    returned by ``pack_columns`` with start and end in seconds of local time
+    since midnight, see ``pack_day``.
+
+    For lookups the entries are grouped by their duration like the events
+    of an ``EventIndex``, so a single long event does not widen the scan
+    over the short ones.
+    """
+
+    def __init__(self, ordinal, all_day, timed):
+
+        self.ordinal = ordinal
+        self.all_day = all_day
+        self.timed = timed
+
+        self._groups = {} # bit length of the duration -> starts and entries
+        for entry in timed:
+            starts, entries = self._groups.setdefault(
+                int(entry[2] - entry[1]).bit_length(), ([], []))
+            starts.append(entry[1])
+            entries.append(entry)
+
+
+    def between(self, top, bottom):
+        """
+        Returns the entries of ``timed`` overlapping the seconds from ``top``
+        to ``bottom``.
+        """
+
+        result = []
+        for bits, (starts, entries) in self._groups.iteritems():
+            # Entries of this group are shorter than 2 ** bits seconds
+            lo = bisect_left(starts, top - (1 << bits))
+            hi = bisect_left(starts, bottom)
+            result.extend(t for t in entries[lo:hi] if t[2] > top)
+        return result
+
+
+def day_bounds(ordinal):
+    """Returns the timestamps of the beginning and end of the day."""
+
+    day = datetime.date.fromordinal(ordinal)
+    following = datetime.date.fromordinal(ordinal + 1)
+    return time.mktime(day.timetuple()), time.mktime(following.timetuple())
+
+
+def clock_seconds(timestamp):
+    """Returns the seconds since midnight of the local time of ``timestamp``."""
+
+    t = time.localtime(timestamp)
+    return t.tm_hour * 3600 + t.tm_min * 60 + t.tm_sec
+
+
+def pack_day(ordinal, events):
+    """
+    Returns the ``DayLayout`` of ``events`` on the given day. Events are
+    placed by the local time they start and end at, so they stay at their
+    hour on days which are shorter or longer because of a change to or from
+    daylight saving time. Which events lie on the day is decided by its real
+    length.
+    """
+
+    begin, end = day_bounds(ordinal)
+
+    all_day = []
+    intervals = []
+    for event in events:
+        # Ends are stored one second early for events ending at midnight
+        if event.start_timestamp <= begin and event.end_timestamp >= end - 1:
+            all_day.append(event)
+            continue
+        start = 0 if event.start_timestamp <= begin else clock_seconds(event.start_timestamp)
+        stop = SECONDS_PER_DAY if event.end_timestamp >= end else clock_seconds(event.end_timestamp)
+        intervals.append((start, min(max(stop, start + MIN_DURATION), SECONDS_PER_DAY), event))
+
+    all_day.sort(key=lambda e: (e.title, e.uid))
+    return DayLayout(ordinal, all_day, pack_columns(intervals))
+
+
+class LayoutEngine(object):
+    """
+    Assigns events to lanes week by week.
+
+    Week layouts are computed on demand and cached; adding, updating or
+    removing an event only invalidates the weeks it touches. Events are also
+    indexed per calendar, so hiding or showing a calendar only invalidates
+    the cached weeks containing events of that calendar.
+    """
+
+    def __init__(self):
+
+        self.index = EventIndex()
+        self.calendars = {} # calendar uid -> EventIndex
+        self.hidden = set() # uids of the calendars which are not active
+        self._weeks = {}
+        self._days = {} # (ordinal, single_day) -> DayLayout
+        self._years = {} # year -> number of visible events per day
+
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, uid):
+        return uid in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+
+    def get(self, uid):
+        return self.index.get(uid)
+
+
+    def add(self, event):
+        """Adds or replaces ``event``, returns the set of affected weeks."""
+
+        weeks = set()
+        if event.uid in self.index:
+            previous = self.index.get(event.uid)
+            weeks.update(iter_weeks(*self.index.span(event.uid)))
+            self._calendar_remove(previous)
+            self._occupy(previous, -1)
+
+        self.index.add(event)
+        self.calendars.setdefault(event.calendar_uid, EventIndex()).add(event)
+        weeks.update(iter_weeks(*event_span(event)))
+        self._occupy(event, 1)
+
+        self.invalidate(weeks)
+        return weeks
+
+    update = add
+
+
+    def remove(self, event):
+        """Removes ``event``, returns the set of affected weeks."""
+
+        weeks = set(iter_weeks(*self.index.span(event.uid)))
+        previous = self.index.get(event.uid)
+        self._calendar_remove(previous)
+        self._occupy(previous, -1)
+        self.index.remove(event)
+
+        self.invalidate(weeks)
+        return weeks
+
+
+    def _calendar_remove(self, event):
+
+        index = self.calendars[event.calendar_uid]
+        index.remove(event)
+        if not len(index):
+            del self.calendars[event.calendar_uid]
+
+
+    def _occupy(self, event, delta):
+        """Adds ``delta`` to the cached day counts of ``event``'s days."""
+
+        if not self.visible(event):
+            return
+
+        span = event_span(event)
+        for year, counts in self._years.iteritems():
+            add_span(counts, year_bounds(year)[0], span, delta)
+
+
+    def visible(self, event):
+        return event.calendar_uid not in self.hidden
+
+
+    def set_visible(self, calendar_uid, visible):
+        """
+        Shows or hides the events of a calendar, returns the set of affected
+        weeks among those which have been laid out.
+        """
+
+        changed = (calendar_uid in self.hidden) == visible
+
+        if visible:
+            self.hidden.discard(calendar_uid)
+        else:
+            self.hidden.add(calendar_uid)
+
+        index = self.calendars.get(calendar_uid)
+        if index is None:
+            return set()
+
+        if changed:
+            for year in self._years:
+                first, last = year_bounds(year)
+                spans = [event_span(e) for e in index.query(first, last)]
+                if spans:
+                    add_counts(self._years[year], count_days(first, last, spans),
+                               1 if visible else -1)
+
+        laid_out = set(self._weeks)
+        laid_out.update(week_start(day) for day, single_day in self._days)
+        weeks = set(week for week in laid_out if index.query(week, week + 6))
+        self.invalidate(weeks)
+        return weeks
+
+
+    def invalidate(self, weeks=None):
+        """Drops the cached layouts of ``weeks`` or of all weeks."""
+
+        if weeks is None:
+            self._weeks.clear()
+            self._days.clear()
+        else:
+            for week in weeks:
+                self._weeks.pop(week, None)
+                for day in range(week, week + 7):
+                    self._days.pop((day, False), None)
+                    self._days.pop((day, True), None)
+
+
+    def week(self, week):
+        """Returns the ``WeekLayout`` for the week starting on ``week``."""
+
+        layout = self._weeks.get(week)
+        if layout is None:
+            events = [e for e in self.index.query(week, week + 6) if self.visible(e)]
+            layout = self._weeks[week] = pack_week(week, events)
+        return layout
+
+
+    def on(self, ordinal):
+        """Returns a list of ``(event, lane)`` pairs for the given day."""
+        return self.week(week_start(ordinal)).on(ordinal)
+
+
+    def day(self, ordinal, single_day=False):
+        """
+        Returns the ``DayLayout`` for the given day. With ``single_day`` only
+        the events starting and ending on that day are laid out, leaving out
+        those which are shown as bars in the week view.
+        """
+
+        key = (ordinal, single_day)
+        layout = self._days.get(key)
+        if layout is None:
+            events = [e for e in self.index.query(ordinal, ordinal) if self.visible(e)
+                      and not (single_day and e.start_ordinal != e.end_ordinal)]
+            layout = self._days[key] = pack_day(ordinal, events)
+        return layout
+
+
+    def year(self, year):
+        """
+        Returns the number of visible events on every day of ``year``. The
+        counts are kept up to date as events change.
+        """
+
+        counts = self._years.get(year)
+        if counts is None:
+            first, last = year_bounds(year)
+            spans = [event_span(e) for e in self.index.query(first, last)
+                     if self.visible(e)]
+            counts = self._years[year] = count_days(first, last, spans)
+        return counts
@@ -0,0 +1,79 @@
+"""
+Per-day event counts over a range of days, e.g. the days of a year.
+
+The counts are computed from the day spans of the events with a difference
+array: every span adds one at its first day and subtracts one after its last
+day, the running sum of these differences is the number of events per day.
+NumPy is used if it is installed, otherwise the counts are plain lists.
+"""
+
+import datetime
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def year_bounds(year):
+    """Returns the ordinals of the first and the last day of ``year``."""
+    return (datetime.date(year, 1, 1).toordinal(),
+            datetime.date(year, 12, 31).toordinal())
+
+
+def count_days(first, last, spans):
+    """
+    Returns the number of ``spans``, ``(start, end)`` pairs of ordinals,
+    touching each day from ``first`` to ``last``. Every span has to touch
+    at least one of these days.
+    """
+
+    days = last - first + 1
+
+    if numpy is not None:
+        spans = numpy.array(spans, dtype=numpy.int64).reshape(-1, 2)
+        starts = numpy.clip(spans[:, 0] - first, 0, days - 1)
+        ends = numpy.clip(spans[:, 1] - first + 1, 1, days)
+        differences = (numpy.bincount(starts, minlength=days + 1) -
+                       numpy.bincount(ends, minlength=days + 1))
+        return numpy.cumsum(differences[:days])
+
+    differences = [0] * (days + 1)
+    for start, end in spans:
+        differences[max(start, first) - first] += 1
+        differences[min(end, last) - first + 1] -= 1
+
+    counts = []
+    count = 0
+    for difference in differences[:days]:
+        count += difference
+        counts.append(count)
+    return counts
+
+
+def add_span(counts, first, span, delta):
+    """
+    Adds ``delta`` to the ``counts`` of a range starting on ``first`` for
+    all days of ``span`` lying in that range.
+    """
+
+    start = max(span[0] - first, 0)
+    end = min(span[1] - first + 1, len(counts))
+    if start >= end:
+        return
+
+    if numpy is not None and isinstance(counts, numpy.ndarray):
+        counts[start:end] += delta
+    else:
+        for day in range(start, end):
+            counts[day] += delta
+
+
+def add_counts(counts, other, factor=1):
+    """Adds ``other`` times ``factor`` to ``counts`` in place."""
+
+    if numpy is not None and isinstance(counts, numpy.ndarray):
+        counts += other * factor
+    else:
+        for day, count in enumerate(other):
+            counts[day] += count * factor
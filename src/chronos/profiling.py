@@ -0,0 +1,157 @@
+"""
+Opt-in timing of hot paths.
+
+Set ``CHRONOS_PROFILE`` to ``1`` to collect the durations of all spans and
+print their statistics to stderr on exit or when the process receives
+``SIGUSR1``. ``0`` or an empty value disables profiling, any other value is
+used as the path of the file the statistics are written to. Counts, totals
+and maxima cover all durations, the percentiles the last ``SAMPLES`` ones
+of every span. When profiling is disabled, ``timed`` returns the decorated
+function unchanged and ``span`` a shared no-op context manager.
+"""
+
+import os
+import sys
+import time
+import atexit
+import signal
+from collections import defaultdict, deque
+
+TARGET = os.environ.get('CHRONOS_PROFILE', '')
+ENABLED = TARGET not in ('', '0')
+
+# Number of recent durations kept per span for the percentiles
+SAMPLES = 1000
+
+
+class Durations(object):
+    """The statistics of the durations recorded for one span."""
+
+    __slots__ = ('count', 'total', 'maximum', 'recent')
+
+    def __init__(self):
+
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self.recent = deque(maxlen=SAMPLES)
+
+
+    def append(self, duration):
+
+        self.count += 1
+        self.total += duration
+        self.maximum = max(self.maximum, duration)
+        self.recent.append(duration)
+
+_durations = defaultdict(Durations)
+
+
+class _NullSpan(object):
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *args):
+        pass
+
+_null_span = _NullSpan()
+
+
+class Span(object):
+
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+
+    def __exit__(self, *args):
+        _durations[self.name].append(time.time() - self.start)
+
+
+def span(name):
+    """Returns a context manager recording the duration of its block."""
+
+    if ENABLED:
+        return Span(name)
+    return _null_span
+
+
+def timed(name):
+    """A decorator recording the duration of every call under ``name``."""
+
+    def decorator(function):
+
+        if not ENABLED:
+            return function
+
+        def wrapper(*args, **kwargs):
+            start = time.time()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                _durations[name].append(time.time() - start)
+
+        wrapper.__name__ = function.__name__
+        wrapper.__doc__ = function.__doc__
+        return wrapper
+
+    return decorator
+
+
+def record(name, duration):
+    """Records a duration measured elsewhere."""
+
+    if ENABLED:
+        _durations[name].append(duration)
+
+
+def percentile(values, p):
+    """Returns the ``p``-th percentile of the sorted list ``values``."""
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+def stats():
+    """
+    Returns a dictionary mapping span names to their count, total, p50, p95
+    and maximum duration in seconds.
+    """
+
+    result = {}
+    for name, durations in _durations.iteritems():
+        recent = sorted(durations.recent)
+        result[name] = (durations.count, durations.total,
+                        percentile(recent, 50), percentile(recent, 95),
+                        durations.maximum)
+    return result
+
+
+def dump(stream=None):
+
+    if stream is None:
+        stream = sys.stderr
+
+    stream.write('{0:<28} {1:>8} {2:>11} {3:>9} {4:>9} {5:>9}\n'.format(
+                 'span', 'count', 'total ms', 'p50 ms', 'p95 ms', 'max ms'))
+    for name, values in sorted(stats().iteritems()):
+        count, total, p50, p95, maximum = values
+        stream.write('{0:<28} {1:>8} {2:>11.2f} {3:>9.2f} {4:>9.2f} {5:>9.2f}\n'.format(
+                     name, count, total * 1000, p50 * 1000, p95 * 1000, maximum * 1000))
+    stream.flush()
+
+
+def _dump():
+
+    if TARGET == '1':
+        dump()
+    else:
+        with open(TARGET, 'a') as stream:
+            dump(stream)
+
+
+if ENABLED:
+    atexit.register(_dump)
+    signal.signal(signal.SIGUSR1, lambda signum, frame: _dump())
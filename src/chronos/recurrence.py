@@ -0,0 +1,355 @@
+"""
+Recurring events.
+
+A series is stored as one event carrying a ``Rule``, a subset of the
+iCalendar RRULE: ``FREQ`` (daily, weekly, monthly or yearly), ``INTERVAL``,
+``COUNT``, ``UNTIL`` and, for weekly rules, ``BYDAY``. Single occurrences
+are excluded by the ordinals of their days; an occurrence which was moved
+or changed is excluded from the series and sent as an event of its own.
+
+Occurrences are only computed for the days a view needs, see ``expand``.
+"""
+
+import time
+import calendar
+import datetime
+from bisect import bisect_left, bisect_right
+
+from chronos.layout import week_start
+from chronos.utils import LRUCache, days_in_month
+
+DAILY = 'DAILY'
+WEEKLY = 'WEEKLY'
+MONTHLY = 'MONTHLY'
+YEARLY = 'YEARLY'
+
+WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+
+# Number of series whose occurrences are kept, see ``expand``
+EXPANSION_CACHE_SIZE = 256
+
+_expansions = LRUCache(EXPANSION_CACHE_SIZE)
+
+
+def parse_until(value):
+    """
+    Returns the timestamp of an RRULE ``UNTIL`` value. Values ending in
+    ``Z`` are in UTC, all others in local time.
+    """
+
+    utc = value.endswith('Z')
+    value = value.rstrip('Z')
+    if 'T' in value:
+        parsed = datetime.datetime.strptime(value, '%Y%m%dT%H%M%S')
+    else:
+        # A date includes the whole day
+        parsed = datetime.datetime.strptime(value, '%Y%m%d').replace(hour=23, minute=59, second=59)
+
+    if utc:
+        return float(calendar.timegm(parsed.timetuple()))
+    return time.mktime(parsed.timetuple())
+
+
+def local_timestamp(value):
+    """Returns the timestamp of ``value``, a naive datetime in local time."""
+    return time.mktime(value.timetuple()) + value.microsecond / 1e6
+
+
+class Rule(object):
+    """
+    How a series repeats. Rules are immutable and compare equal if they
+    describe the same series, so they can be used as keys.
+    """
+
+    __slots__ = ('freq', 'interval', 'count', 'until', 'byday', 'exdates', '_key')
+
+    def __init__(self, freq, interval=1, count=None, until=None, byday=(), exdates=()):
+
+        if freq not in (DAILY, WEEKLY, MONTHLY, YEARLY):
+            raise ValueError('Unsupported frequency {0}'.format(freq))
+        if interval < 1:
+            raise ValueError('The interval has to be positive')
+
+        self.freq = freq
+        self.interval = interval
+        self.count = count
+        self.until = until
+        self.byday = tuple(sorted(set(byday)))
+        self.exdates = frozenset(exdates)
+        self._key = (freq, interval, count, until, self.byday, self.exdates)
+
+
+    @classmethod
+    def parse(cls, rrule, exdates=()):
+        """
+        Returns the ``Rule`` for ``rrule``, e.g. ``FREQ=WEEKLY;BYDAY=MO,WE``,
+        excluding the occurrences on the days of the timestamps ``exdates``.
+        Raises ``ValueError`` for rules which are not supported.
+        """
+
+        parts = {}
+        for part in rrule.upper().replace('RRULE:', '').split(';'):
+            if part:
+                name, _, value = part.partition('=')
+                parts[name] = value
+
+        freq = parts.pop('FREQ', None)
+        interval = int(parts.pop('INTERVAL', 1))
+        count = int(parts['COUNT']) if 'COUNT' in parts else None
+        until = parse_until(parts['UNTIL']) if 'UNTIL' in parts else None
+        parts.pop('COUNT', None)
+        parts.pop('UNTIL', None)
+        parts.pop('WKST', None)
+
+        byday = ()
+        if 'BYDAY' in parts:
+            if freq != WEEKLY:
+                raise ValueError('BYDAY is only supported for weekly rules')
+            byday = [WEEKDAYS.index(day) for day in parts.pop('BYDAY').split(',')]
+
+        if parts:
+            raise ValueError('Unsupported rule parts {0}'.format(', '.join(sorted(parts))))
+
+        exdates = [datetime.date(*time.localtime(t)[:3]).toordinal() for t in exdates]
+
+        return cls(freq, interval, count, until, byday, exdates)
+
+
+    def __str__(self):
+
+        parts = ['FREQ=' + self.freq]
+        if self.interval != 1:
+            parts.append('INTERVAL={0}'.format(self.interval))
+        if self.count is not None:
+            parts.append('COUNT={0}'.format(self.count))
+        if self.until is not None:
+            parts.append('UNTIL=' + time.strftime('%Y%m%dT%H%M%SZ', time.gmtime(self.until)))
+        if self.byday:
+            parts.append('BYDAY=' + ','.join(WEEKDAYS[day] for day in self.byday))
+        return ';'.join(parts)
+
+
+    def __repr__(self):
+        return '<Rule {0}>'.format(self)
+
+
+    def __eq__(self, other):
+        return isinstance(other, Rule) and self._key == other._key
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self._key)
+
+
+    def exdate_timestamps(self):
+        """Returns the excluded days as timestamps of their midnight."""
+
+        return [time.mktime(datetime.date.fromordinal(o).timetuple())
+                for o in sorted(self.exdates)]
+
+
+    def days(self, start, since):
+        """
+        Yields the ordinals of the days the occurrences of a series whose
+        first occurrence is on the day ``start`` fall on, in order. Days
+        before ``since`` may be left out.
+
+        The first occurrence is always part of the series, even if it does
+        not match the rule.
+        """
+
+        if self.count is not None:
+            # Occurrences are counted from the first one
+            since = start
+
+        if self.freq == DAILY or self.freq == WEEKLY and not self.byday:
+            period = self.interval * (7 if self.freq == WEEKLY else 1)
+            day = start + max(0, (since - start) // period) * period
+            while True:
+                yield day
+                day += period
+
+        elif self.freq == WEEKLY:
+            period = self.interval * 7
+            week = week_start(start)
+            if start - week not in self.byday:
+                yield start
+            week += max(0, (week_start(since) - week) // period) * period
+            while True:
+                for weekday in self.byday:
+                    if week + weekday >= start:
+                        yield week + weekday
+                week += period
+
+        else:
+            first = datetime.date.fromordinal(start)
+            period = self.interval * (12 if self.freq == YEARLY else 1)
+            later = datetime.date.fromordinal(max(since, start))
+            months = (later.year - first.year) * 12 + later.month - first.month
+
+            index = max(0, months // period)
+            while True:
+                month = first.month - 1 + index * period
+                year, month = first.year + month // 12, month % 12 + 1
+                # Months without the day of the first occurrence are skipped
+                if first.day <= days_in_month(year, month):
+                    yield datetime.date(year, month, first.day).toordinal()
+                index += 1
+
+
+    def iter_occurrences(self, start, end, since=None):
+        """
+        Yields the day, start and end of the occurrences of a series whose
+        first occurrence lasts from the timestamp ``start`` to ``end``, in
+        order. Occurrences ending before the day ``since`` may be left out.
+        """
+
+        begin = datetime.datetime.fromtimestamp(start)
+        finish = datetime.datetime.fromtimestamp(end)
+        start_day = begin.toordinal()
+        length = finish.toordinal() - start_day
+
+        if since is None:
+            since = start_day
+
+        for number, day in enumerate(self.days(start_day, since - length)):
+            if self.count is not None and number >= self.count:
+                return
+
+            # Occurrences keep the local times of the first one, so their
+            # length changes on days with a change of daylight saving time
+            offset = datetime.timedelta(day - start_day)
+            occurrence = local_timestamp(begin + offset)
+            if self.until is not None and occurrence > self.until:
+                return
+
+            if day not in self.exdates:
+                yield day, occurrence, local_timestamp(finish + offset)
+
+
+    def occurrences(self, start, end, first, last):
+        """
+        Returns the ``(start, end)`` timestamps of the occurrences of a series
+        whose first occurrence lasts from ``start`` to ``end`` touching a day
+        between the ordinals ``first`` and ``last``.
+        """
+
+        length = (datetime.datetime.fromtimestamp(end).toordinal() -
+                  datetime.datetime.fromtimestamp(start).toordinal())
+
+        result = []
+        for day, occurrence_start, occurrence_end in self.iter_occurrences(start, end, first):
+            if day > last:
+                break
+            if day + length >= first:
+                result.append((occurrence_start, occurrence_end))
+        return result
+
+
+    def last_day(self, start, end):
+        """
+        Returns the ordinal of the last day touched by a series whose first
+        occurrence lasts from ``start`` to ``end``, or ``None`` if it does
+        not end.
+        """
+
+        length = (datetime.datetime.fromtimestamp(end).toordinal() -
+                  datetime.datetime.fromtimestamp(start).toordinal())
+
+        if self.count is not None:
+            last = datetime.datetime.fromtimestamp(start).toordinal()
+            for day, occurrence_start, occurrence_end in self.iter_occurrences(start, end):
+                last = day
+            return last + length
+        if self.until is not None:
+            return datetime.datetime.fromtimestamp(self.until).toordinal() + length
+        return None
+
+
+class Series(object):
+    """
+    The occurrences of a series computed so far, from the first one on.
+    More are computed as later days are asked for.
+    """
+
+    __slots__ = ('length', 'days', 'occurrences', '_pending')
+
+    def __init__(self, rule, start, end):
+
+        self.length = (datetime.datetime.fromtimestamp(end).toordinal() -
+                       datetime.datetime.fromtimestamp(start).toordinal())
+        self.days = [] # days of the occurrences, sorted
+        self.occurrences = [] # their (start, end) timestamps
+        self._pending = rule.iter_occurrences(start, end)
+
+
+    def between(self, first, last):
+        """
+        Returns the ``(start, end)`` timestamps of the occurrences touching
+        a day between the ordinals ``first`` and ``last``.
+        """
+
+        while self._pending is not None and (not self.days or self.days[-1] <= last):
+            try:
+                day, start, end = next(self._pending)
+            except StopIteration:
+                self._pending = None
+                break
+            self.days.append(day)
+            self.occurrences.append((start, end))
+
+        lo = bisect_left(self.days, first - self.length)
+        hi = bisect_right(self.days, last)
+        return self.occurrences[lo:hi]
+
+
+def expand(rule, start, end, first, last):
+    """
+    Returns ``rule.occurrences(start, end, first, last)``. The occurrences
+    are cached per series, given by its rule and first occurrence, so later
+    windows only compute the occurrences not seen before.
+    """
+
+    key = (rule, start, end)
+    series = _expansions.get(key)
+    if series is None:
+        series = _expansions[key] = Series(rule, start, end)
+    return series.between(first, last)
+
+
+if __name__ == '__main__':
+    import os
+
+    os.environ['TZ'] = 'Europe/Berlin'
+    time.tzset()
+
+    def timestamp(*args):
+        return local_timestamp(datetime.datetime(*args))
+
+    def days(first, last):
+        return (datetime.date(*first).toordinal(), datetime.date(*last).toordinal())
+
+    # UNTIL in UTC ends the series at 13:00 local time
+    rule = Rule.parse('FREQ=DAILY;UNTIL=20260109T120000Z')
+    occurrences = rule.occurrences(timestamp(2026, 1, 5, 14), timestamp(2026, 1, 5, 15),
+                                   *days((2026, 1, 1), (2026, 1, 31)))
+    assert len(occurrences) == 4, occurrences
+
+    # The first occurrence counts even if it does not match BYDAY
+    rule = Rule.parse('FREQ=WEEKLY;BYDAY=MO,WE;COUNT=3')
+    occurrences = rule.occurrences(timestamp(2026, 10, 20, 9), timestamp(2026, 10, 20, 10),
+                                   *days((2026, 10, 1), (2026, 12, 31)))
+    assert [time.localtime(s)[:3] for s, e in occurrences] == \
+           [(2026, 10, 20), (2026, 10, 21), (2026, 10, 26)], occurrences
+
+    # All day occurrences keep covering their day across daylight saving time
+    rule = Rule.parse('FREQ=WEEKLY')
+    start, end = timestamp(2024, 3, 17), timestamp(2024, 3, 17, 23, 59, 59)
+    for day in ((2024, 3, 31), (2024, 10, 27)):
+        [(s, e)] = rule.occurrences(start, end, *days(day, day))
+        assert time.localtime(s)[:6] == day + (0, 0, 0), time.localtime(s)
+        assert time.localtime(e)[:6] == day + (23, 59, 59), time.localtime(e)
+
+    print 'ok'
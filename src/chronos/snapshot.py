@@ -0,0 +1,104 @@
+import os
+import json
+import sqlite3
+
+# Bump this whenever the schema changes, older snapshots are ignored then
+SNAPSHOT_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE calendars (position INTEGER, uid TEXT, data TEXT);
+CREATE TABLE events (uid TEXT, title TEXT, description TEXT, start REAL,
+                     end REAL, location TEXT, calendar_uid TEXT, rrule TEXT,
+                     exdates TEXT);
+"""
+
+
+def default_path():
+
+    cache = os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache'))
+    return os.path.join(cache, 'chronos', 'snapshot.sqlite')
+
+
+class Snapshot(object):
+    """
+    A local copy of the calendars and events last seen, stored in a SQLite
+    database, so the first frame can be drawn before the PIM service answers.
+    """
+
+    def __init__(self, path=None):
+
+        self.path = path or default_path()
+
+
+    def load(self):
+        """
+        Returns the stored calendars and events as dictionaries like those
+        sent by the PIM service, or two empty lists if there is no usable
+        snapshot.
+        """
+
+        if not os.path.exists(self.path):
+            return [], []
+
+        try:
+            connection = sqlite3.connect(self.path)
+            try:
+                version = connection.execute('PRAGMA user_version').fetchone()[0]
+                if version != SNAPSHOT_VERSION:
+                    return [], []
+
+                calendars = [json.loads(data) for data, in connection.execute(
+                    'SELECT data FROM calendars ORDER BY position')]
+                events = [{
+                        'uid': uid,
+                        'title': title,
+                        'description': description,
+                        'start': start,
+                        'end': end,
+                        'location': location,
+                        'calendar_uid': calendar_uid,
+                        'rrule': rrule,
+                        'exdates': json.loads(exdates) if exdates else ()
+                    } for uid, title, description, start, end, location, calendar_uid,
+                          rrule, exdates
+                    in connection.execute('SELECT * FROM events')]
+            finally:
+                connection.close()
+        except sqlite3.Error:
+            return [], []
+
+        return calendars, events
+
+
+    def save(self, calendars, events):
+        """
+        Stores ``calendars``, dictionaries as sent by the PIM service, and
+        ``events``, ``Event`` instances. The snapshot is written to a
+        temporary file first and then moved into place.
+        """
+
+        directory = os.path.dirname(self.path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        temporary = self.path + '.tmp'
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+        connection = sqlite3.connect(temporary)
+        try:
+            connection.executescript(SCHEMA)
+            connection.execute('PRAGMA user_version = {0}'.format(SNAPSHOT_VERSION))
+            connection.executemany('INSERT INTO calendars VALUES (?, ?, ?)',
+                ((i, c['uid'], json.dumps(c)) for i, c in enumerate(calendars)))
+            connection.executemany('INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                ((e.uid, e.title, e.description, e.start_timestamp,
+                  e.end_timestamp, e.location, e.calendar_uid,
+                  str(e.rule) if e.rule else None,
+                  json.dumps(e.rule.exdate_timestamps()) if e.rule else None)
+                 for e in events))
+            connection.commit()
+        finally:
+            connection.close()
+
+        os.rename(temporary, self.path)
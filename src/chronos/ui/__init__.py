@@ -1,11 +1,12 @@
 import os
+from datetime import timedelta
 from gi.repository import Gtk as gtk, GObject as gobject
 
 from chronos.ui.month import MonthView
-from chronos.ui.day import DayView
 from chronos.ui.tag import Tag
 
-from chronos.utils import datetime
+from chronos.utils import datetime, days_in_month
+from chronos.occupancy import year_bounds
 
 MONTH_YEAR_TEMPLATE = '<span weight="bold" size="x-large">%B %Y</span>'
 
@@ -14,6 +15,8 @@ class CalendarUI(gobject.GObject):
 
     __gsignals__ = {
         'calendar-state-changed': (gobject.SignalFlags.RUN_LAST, None, (str, bool)),
+        'date-changed': (gobject.SignalFlags.RUN_LAST, None, (object,)),
+        'range-needed': (gobject.SignalFlags.RUN_LAST, None, (int, int)),
     }
 
     def __init__(self):
@@ -39,75 +42,233 @@ class CalendarUI(gobject.GObject):
         # Set the current year and month
         self.month_year_label.set_markup(self.date.strftime(MONTH_YEAR_TEMPLATE))
 
-        # Construct the custom interfaces
+        # Construct the custom interfaces, the day, week and year view are
+        # only built once they are needed
         self.month_view = MonthView(self.date)
-        self.day_view = DayView()
+        self._day_view = None
+        self._week_view = None
+        self._year_view = None
+
+        # The month, week and year view share one place, only one is shown
+        self.views = gtk.Notebook()
+        self.views.set_show_tabs(False)
+        self.views.set_show_border(False)
+        self.views.append_page(self.month_view, None)
+
+        toolbar = self.interface.get_object('toolbar')
+        self.week_button = gtk.ToggleButton('Week')
+        self.year_button = gtk.ToggleButton('Year')
+        for button in (self.week_button, self.year_button):
+            button.set_relief(gtk.ReliefStyle.NONE)
+            toolbar.pack_start(button, False, False, 5)
 
         # Connect the signals
         self.button_previous.connect('clicked', self.month_change_cb)
         self.button_next.connect('clicked', self.month_change_cb)
+        self.week_button.connect('toggled', self.view_toggled_cb)
+        self.year_button.connect('toggled', self.view_toggled_cb)
 
         # TODO: Make use of MonthViews signals!
         self.month_view.connect('day-selected', self.day_selected_cb)
 
-        self.paned.add1(self.month_view)
-        self.paned.add2(self.day_view)
+        self.paned.add1(self.views)
 
         # Display the calendars as tags
         self.calendars = gtk.HBox()
         self.calendars.set_spacing(1)
+        self.tags = {}
         self.layout.pack_start(self.calendars, False, False, 0)
 
         # Show the window
         self.window.show_all()
 
 
+    @property
+    def day_view(self):
+
+        if self._day_view is None:
+            from chronos.ui.day import DayView
+
+            self._day_view = DayView(self.month_view.layout)
+            self.paned.add2(self._day_view)
+            self._day_view.show_all()
+
+        return self._day_view
+
+
+    @property
+    def week_view(self):
+
+        if self._week_view is None:
+            from chronos.ui.week import WeekView
+
+            self._week_view = WeekView(self.month_view.layout)
+            self._week_view.set_date(self.date)
+            self._week_view.connect('day-selected', self.day_selected_cb)
+            self.views.append_page(self._week_view, None)
+            self._week_view.show_all()
+
+        return self._week_view
+
+
+    @property
+    def year_view(self):
+
+        if self._year_view is None:
+            from chronos.ui.year import YearView
+
+            self._year_view = YearView(self.month_view.layout)
+            self._year_view.set_year(self.date.year)
+            self._year_view.connect('date-selected', self.year_date_selected_cb)
+            self.views.append_page(self._year_view, None)
+            self._year_view.show_all()
+
+        return self._year_view
+
+
     def set_date(self, date):
 
         self.date = date
         self.month_view.set_date(self.date)
+        if self._week_view is not None:
+            self._week_view.set_date(self.date)
+        if self._year_view is not None:
+            self._year_view.set_year(self.date.year)
+            self.load_year()
 
         self.month_year_label.set_markup(self.date.strftime(MONTH_YEAR_TEMPLATE))
 
+        self.emit('date-changed', self.date)
+
 
     def add_events(self, events):
 
         self.month_view.add_events(events)
+        self.refresh_views()
 
     def remove_events(self, events):
 
-        self.view.remove_events(events)
+        self.month_view.remove_events(events)
+        self.refresh_views()
 
     def update_events(self, events):
 
         self.month_view.update_events(events)
+        self.refresh_views()
 
+    def set_calendar_visible(self, uid, visible):
 
-    def set_calendars(self, calendars):
+        self.month_view.set_calendar_visible(uid, visible)
+        self.refresh_views()
+
+
+    def refresh_views(self):
+        """Redraws the other views if their events changed."""
 
-        for child in self.calendars.get_children():
-            self.calendars.remove(child)
-            child.destroy()
+        if self._day_view is not None:
+            self._day_view.refresh()
+        if self._week_view is not None:
+            self._week_view.refresh()
+        if self._year_view is not None:
+            self._year_view.refresh()
 
+
+    def set_calendars(self, calendars):
+        """
+        Shows ``calendars`` as tags in the given order. Tags of calendars
+        which are shown already are reused and relabeled if they were
+        renamed.
+        """
+
+        uids = set(calendar['uid'] for calendar in calendars)
+        for uid in self.tags.keys():
+            if uid not in uids:
+                tag = self.tags.pop(uid)
+                self.calendars.remove(tag)
+                tag.destroy()
+
+        renamed = False
         for calendar in calendars:
-            tag = Tag(calendar['uid'], calendar['name'], calendar['color'], calendar['active'])
-            tag.show()
-            self.calendars.pack_start(tag, False, False, 0)
+            tag = self.tags.get(calendar['uid'])
+            if tag is not None and tag.label != calendar['name']:
+                tag.label = calendar['name']
+                renamed = True
+
+        # Tags which are kept stay in order unless one of them was renamed,
+        # so usually only new ones are moved
+        for position, calendar in enumerate(calendars):
+            if calendar['uid'] not in self.tags:
+                self.add_calendar(calendar, position)
+            elif renamed:
+                self.calendars.reorder_child(self.tags[calendar['uid']], position)
+
+
+    def add_calendar(self, calendar, position):
+        """Inserts a tag for ``calendar`` at ``position``."""
+
+        tag = Tag(calendar['uid'], calendar['name'], calendar['color'], calendar['active'])
+        tag.show()
+        self.calendars.pack_start(tag, False, False, 0)
+        self.calendars.reorder_child(tag, position)
+
+        tag.connect('activity-changed', self.calendar_state_change_cb)
+
+        self.tags[calendar['uid']] = tag
 
-            tag.connect('activity-changed', self.calendar_state_change_cb)
 
     def month_change_cb(self, button):
 
-        if button == self.button_previous:
+        if self.year_button.get_active():
+            year = self.date.year + (1 if button == self.button_next else -1)
+            day = min(self.date.day, days_in_month(year, self.date.month))
+            self.set_date(datetime.from_datetime(self.date.replace(year=year, day=day)))
+        elif self.week_button.get_active():
+            # Step by weeks while the week view is shown
+            step = timedelta(days=7 if button == self.button_next else -7)
+            self.set_date(datetime.from_datetime(self.date + step))
+        elif button == self.button_previous:
             self.set_date(self.date.previous_month)
         elif button == self.button_next:
             self.set_date(self.date.next_month)
 
 
+    def view_toggled_cb(self, button):
+
+        # Only one of the toggle buttons can be active
+        if button.get_active():
+            for other in (self.week_button, self.year_button):
+                if other is not button:
+                    other.set_active(False)
+
+        if self.year_button.get_active():
+            view = self.year_view
+            self.load_year()
+        elif self.week_button.get_active():
+            view = self.week_view
+        else:
+            view = self.month_view
+        self.views.set_current_page(self.views.page_num(view))
+
+
+    def load_year(self):
+        """Asks for the events of the year shown in the year view."""
+
+        if self.year_button.get_active():
+            self.emit('range-needed', *year_bounds(self.date.year))
+
+
+    def year_date_selected_cb(self, view, date):
+
+        self.year_button.set_active(False)
+        self.set_date(date)
+
+
     def calendar_state_change_cb(self, calendar, state):
 
         self.emit('calendar-state-changed', calendar.uid, state)
 
 
     def day_selected_cb(self, view, date):
-        print 'Date', date, 'was selected'
+
+        self.day_view.set_date(date)
+        self.day_view.show()
@@ -0,0 +1,95 @@
+"""
+Transitions of numeric widget attributes driven by the frame clock.
+"""
+
+from math import cos, pi
+
+
+def ease_sine(progress):
+    return (1 - cos(pi * progress)) / 2.0
+
+
+class Transition(object):
+
+    __slots__ = ('origin', 'target', 'duration', 'begin')
+
+    def __init__(self, origin, target, duration):
+
+        self.origin = origin
+        self.target = target
+        self.duration = duration
+        self.begin = None
+
+
+class Animator(object):
+    """
+    Animates attributes of ``widget`` on the frame clock of its toplevel.
+
+    There is at most one transition per attribute. Animating an attribute
+    which is still moving retargets it, starting from its current value. The
+    tick callback is only installed while something is animating.
+    """
+
+    def __init__(self, widget, curve=ease_sine):
+
+        self.widget = widget
+        self.curve = curve
+        self.transitions = {}
+        self._tick = None
+
+
+    def animate(self, name, target, duration):
+        """Moves the attribute ``name`` to ``target`` within ``duration`` ms."""
+
+        transition = self.transitions.get(name)
+        if transition is not None and transition.target == target:
+            return
+
+        value = getattr(self.widget, name)
+        if value == target:
+            self.transitions.pop(name, None)
+            return
+
+        self.transitions[name] = Transition(value, target, duration / 1000.0)
+
+        if self._tick is None:
+            self._tick = self.widget.add_tick_callback(self.tick_cb, None)
+
+
+    def stop(self):
+        """Stops all transitions, leaving the attributes where they are."""
+
+        self.transitions.clear()
+        if self._tick is not None:
+            self.widget.remove_tick_callback(self._tick)
+            self._tick = None
+
+
+    def tick_cb(self, widget, clock, data):
+
+        now = clock.get_frame_time() / 1e6
+
+        for name, transition in self.transitions.items():
+            if transition.begin is None:
+                transition.begin = now
+
+            if transition.duration > 0:
+                progress = min(1.0, (now - transition.begin) / transition.duration)
+            else:
+                progress = 1.0
+
+            if progress < 1:
+                origin = transition.origin
+                value = origin + (transition.target - origin) * self.curve(progress)
+            else:
+                value = transition.target
+                del self.transitions[name]
+            setattr(widget, name, value)
+
+        widget.queue_draw()
+
+        if self.transitions:
+            return True
+
+        self._tick = None
+        return False
@@ -0,0 +1,103 @@
+"""
+Geometry and drawing of the event bars shown in lanes by the month and the
+week view.
+"""
+
+from chronos.layout import week_start
+
+EVENT_HEIGHT = 15
+PADDING_EVENT = 3
+PADDING_START = 5
+PADDING_END = 5
+PADDING_TITLE_LEFT = 8
+
+# Offset of the baseline of a title from the top of its bar
+TITLE_BASELINE = 11
+
+
+def roundedrect(ctx, x, y, w, h, r = 15, left=True, right=True):
+    "Draw a rounded rectangle"
+    #   A****BQ
+    #  H      C
+    #  *      *
+    #  G      D
+    #  PF****E
+
+    ctx.move_to(x+r,y)                      # Move to A
+    if right:
+        ctx.line_to(x+w-r,y)                # Straight line to B
+        ctx.curve_to(x+w,y,x+w,y,x+w,y+r)       # Curve to C, Control points are both at Q
+        ctx.line_to(x+w,y+h-r)                  # Move to D
+        ctx.curve_to(x+w,y+h,x+w,y+h,x+w-r,y+h) # Curve to E
+    else:
+        ctx.line_to(x+w,y)                    # Straight line to Q
+        ctx.line_to(x+w, y+h)                 # Straight line to E
+
+    if left:
+        ctx.line_to(x+r,y+h)                    # Line to F
+        ctx.curve_to(x,y+h,x,y+h,x,y+h-r)       # Curve to G
+        ctx.line_to(x,y+r)                      # Line to H
+        ctx.curve_to(x,y,x,y,x+r,y)             # Curve to A
+    else:
+        ctx.line_to(x,y+h)                    # Straight line to P
+        ctx.line_to(x, y)                     # Straight line to A
+
+
+def lane_top(top, lane):
+    """Returns the y coordinate of ``lane`` below ``top``."""
+    return int(top + PADDING_EVENT + lane * (EVENT_HEIGHT + PADDING_EVENT))
+
+
+def lane_at(top, y):
+    """
+    Returns the lane whose bar covers ``y`` for lanes starting below
+    ``top``, or ``None`` if ``y`` is between two bars.
+    """
+
+    lane, offset = divmod(int(y) - int(top + PADDING_EVENT), EVENT_HEIGHT + PADDING_EVENT)
+    if lane < 0 or offset >= EVENT_HEIGHT:
+        return None
+    return lane
+
+
+def draw_bar(ctx, event, ordinal, x, y, width):
+    """
+    Adds the part of the bar of ``event`` lying on the day ``ordinal`` to
+    the path of ``ctx``. ``x`` and ``width`` are those of the day. The ends
+    of the bar are rounded.
+    """
+
+    if event.start_ordinal == ordinal and event.end_ordinal == ordinal:
+        roundedrect(ctx, x+PADDING_START, y, width-(PADDING_START+PADDING_END), EVENT_HEIGHT, 8)
+    elif event.start_ordinal == ordinal:
+        roundedrect(ctx, x+PADDING_START, y, width-(PADDING_START-1), EVENT_HEIGHT, 8, right=False)
+    elif event.end_ordinal == ordinal:
+        roundedrect(ctx, x, y, width-PADDING_END, EVENT_HEIGHT, 8, left=False)
+    else:
+        ctx.rectangle(x, y, width+1, EVENT_HEIGHT)
+
+
+def calculate_remaining_space(event, ordinal, width):
+    """
+    Returns the remaining space for the title of ``event`` in the week
+    containing the day ``ordinal``, given the ``width`` of a day.
+    """
+
+    start = week_start(ordinal)
+    end = start + 6
+
+    if event.start_ordinal == end:
+        return width
+
+    if event.start_ordinal > start:
+        start = event.start_ordinal
+    else:
+        width -= 2*PADDING_START
+    if event.end_ordinal < end:
+        end = event.end_ordinal
+    else:
+        width -= PADDING_END
+
+    width -= PADDING_TITLE_LEFT
+
+    return (end - start + 1) * width
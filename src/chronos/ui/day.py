@@ -1,7 +1,291 @@
 from gi.repository import Gtk as gtk
 
+from chronos.ui.month import FONT_NORMAL, COLOR_GREY
+from chronos.ui.bars import roundedrect
+from chronos.ui.utils import text_extents, truncate_text
+from chronos.profiling import timed
+
+DATE_TEMPLATE = '<span weight="bold" size="large">%A, %d %B %Y</span>'
+
+FONT_SIZE_HOUR = 10
+FONT_SIZE_EVENT = 10
+
+HOUR_HEIGHT = 48
+HOUR_GUTTER = 50
+EVENT_HEIGHT = 15
+PADDING = 5
+PADDING_EVENT = 2
+PADDING_TITLE = 4
+
+# The hour the view is scrolled to at first
+FIRST_HOUR = 8
+
+# Titles are left out in narrower columns
+MIN_TITLE_WIDTH = 20
+
+SECONDS_PER_PIXEL = 3600.0 / HOUR_HEIGHT
+
+
 class DayView(gtk.VBox):
+    """
+    Shows the events of one day, those covering the whole day on top and
+    the others in an hour grid below. The events are taken from ``layout``,
+    the ``LayoutEngine`` of the month view.
+    """
 
-    def __init__(self):
+    def __init__(self, layout):
 
         gtk.VBox.__init__(self)
+
+        self.layout = layout
+        self.date = None
+        self.day = None
+
+        self.title = gtk.Label()
+        self.title.set_padding(PADDING, PADDING)
+        self.title.set_alignment(0, .5)
+
+        self.all_day = AllDayEvents()
+        self.hours = HourGrid()
+
+        scrolled = gtk.ScrolledWindow()
+        scrolled.set_policy(gtk.PolicyType.NEVER, gtk.PolicyType.AUTOMATIC)
+        scrolled.add_with_viewport(self.hours)
+
+        adjustment = scrolled.get_vadjustment()
+        self._scroll_handler = adjustment.connect('changed', self.adjustment_changed_cb)
+
+        self.pack_start(self.title, False, False, 0)
+        self.pack_start(self.all_day, False, False, 0)
+        self.pack_start(scrolled, True, True, 0)
+
+
+    def set_date(self, date):
+
+        self.date = date
+        self.title.set_markup(date.strftime(DATE_TEMPLATE))
+        self.day = None
+        self.refresh()
+
+
+    def refresh(self):
+        """
+        Fetches the layout of the shown day again. Nothing is redrawn if the
+        events of the day did not change.
+        """
+
+        if self.date is None:
+            return
+
+        day = self.layout.day(self.date.toordinal())
+        if day is not self.day:
+            self.day = day
+            self.all_day.set_day(day)
+            self.hours.set_days([day])
+
+
+    def adjustment_changed_cb(self, adjustment):
+
+        if adjustment.get_upper() >= HOUR_HEIGHT * 24:
+            adjustment.set_value(FIRST_HOUR * HOUR_HEIGHT)
+            adjustment.disconnect(self._scroll_handler)
+
+
+class AllDayEvents(gtk.DrawingArea):
+
+    __gtype_name__ = 'AllDayEvents'
+
+    def __init__(self):
+
+        gtk.DrawingArea.__init__(self)
+
+        self.day = None
+
+        self.connect('draw', self.draw)
+
+
+    def set_day(self, day):
+
+        self.day = day
+        if day.all_day:
+            self.set_size_request(-1, len(day.all_day) * (EVENT_HEIGHT + PADDING_EVENT) + PADDING)
+            self.show()
+        else:
+            self.hide()
+        self.queue_draw()
+
+
+    def draw(self, widget, ctx):
+
+        width = self.get_allocation().width
+
+        ctx.select_font_face(*FONT_NORMAL)
+        ctx.set_font_size(FONT_SIZE_EVENT)
+
+        y = 0
+        for event in self.day.all_day:
+            ctx.set_source_rgb(*event.color)
+            roundedrect(ctx, PADDING, y, width - 2 * PADDING, EVENT_HEIGHT, 8)
+            ctx.fill()
+
+            title = truncate_text(ctx, FONT_NORMAL, FONT_SIZE_EVENT, event.title,
+                                  width - 2 * (PADDING + PADDING_TITLE))
+            ctx.set_source_rgb(0, 0, 0)
+            ctx.move_to(PADDING + PADDING_TITLE, y + 11)
+            ctx.show_text(title)
+
+            y += EVENT_HEIGHT + PADDING_EVENT
+
+
+class HourGrid(gtk.DrawingArea):
+    """
+    The hours of one or more days side by side, with the timed events of
+    every day placed in columns. Only the hours and events within the
+    exposed area are drawn.
+    """
+
+    __gtype_name__ = 'HourGrid'
+
+    def __init__(self):
+
+        gtk.DrawingArea.__init__(self)
+
+        self.days = []
+
+        self.set_size_request(-1, HOUR_HEIGHT * 24)
+        self.set_has_tooltip(True)
+
+        self.connect('draw', self.draw)
+        self.connect('query-tooltip', self.query_tooltip_cb)
+
+
+    def set_days(self, days):
+        """Shows ``days``, a list of ``DayLayout`` instances."""
+
+        self.days = days
+        self.queue_draw()
+
+
+    def day_width(self, width):
+        return (width - HOUR_GUTTER - PADDING) / float(max(1, len(self.days)))
+
+
+    def entries(self, index, top, bottom):
+        """
+        Returns the entries of ``DayLayout.timed`` of the day at ``index``
+        lying between the y coordinates ``top`` and ``bottom``.
+        """
+
+        return self.days[index].between(top * SECONDS_PER_PIXEL,
+                                        bottom * SECONDS_PER_PIXEL)
+
+
+    def event_rect(self, entry, index, width):
+        """
+        Returns the rectangle of an entry of ``DayLayout.timed`` of the day
+        at ``index``.
+        """
+
+        event, start, end, column, columns = entry
+        day_width = self.day_width(width)
+        column_width = day_width / columns
+
+        x = HOUR_GUTTER + index * day_width + column * column_width
+        y = start / SECONDS_PER_PIXEL
+        return x, y, column_width - PADDING_EVENT, (end - start) / SECONDS_PER_PIXEL - PADDING_EVENT
+
+
+    def event_at(self, x, y):
+
+        if not self.days:
+            return None
+
+        width = self.get_allocation().width
+        index = int((x - HOUR_GUTTER) // self.day_width(width))
+        if not 0 <= index < len(self.days):
+            return None
+
+        for entry in self.entries(index, y, y + 1):
+            x1, y1, w, h = self.event_rect(entry, index, width)
+            if x1 <= x < x1 + w:
+                return entry[0]
+        return None
+
+
+    def query_tooltip_cb(self, widget, x, y, keyboard_mode, tooltip):
+
+        event = self.event_at(x, y)
+        if event is None:
+            return False
+
+        text = '{0} - {1}  {2}'.format(event.start.strftime('%H:%M'),
+                                       event.end.strftime('%H:%M'), event.title)
+        if event.location:
+            text += '\n' + event.location
+        tooltip.set_text(text)
+        return True
+
+
+    @timed('day.draw')
+    def draw(self, widget, ctx):
+
+        width = self.get_allocation().width
+        height = self.get_allocation().height
+
+        x1, y1, x2, y2 = ctx.clip_extents()
+        first = max(0, int(y1 // HOUR_HEIGHT))
+        last = min(23, int(y2 // HOUR_HEIGHT))
+
+        ctx.set_source_rgb(1, 1, 1)
+        ctx.rectangle(x1, y1, x2 - x1, y2 - y1)
+        ctx.fill()
+
+        # Hours
+        ctx.select_font_face(*FONT_NORMAL)
+        ctx.set_font_size(FONT_SIZE_HOUR)
+        ctx.set_line_width(1)
+
+        for hour in range(first, last + 1):
+            y = hour * HOUR_HEIGHT
+
+            ctx.set_source_rgba(.8, .8, .8, 1)
+            ctx.move_to(HOUR_GUTTER, y + .5)
+            ctx.line_to(width, y + .5)
+            ctx.stroke()
+
+            label = '{0:02d}:00'.format(hour)
+            x_bearing, y_bearing, t_width = text_extents(ctx, FONT_NORMAL, FONT_SIZE_HOUR, label)[:3]
+            ctx.set_source_rgba(*COLOR_GREY)
+            ctx.move_to(HOUR_GUTTER - PADDING - t_width - x_bearing, y - y_bearing + PADDING)
+            ctx.show_text(label)
+
+        # Separators between the days
+        day_width = self.day_width(width)
+        ctx.set_source_rgba(.8, .8, .8, 1)
+        for index in range(1, len(self.days)):
+            x = int(HOUR_GUTTER + index * day_width) + .5
+            ctx.move_to(x, y1)
+            ctx.line_to(x, min(y2, height))
+        ctx.stroke()
+
+        # Events
+        visible = []
+        for index in range(len(self.days)):
+            left = HOUR_GUTTER + index * day_width
+            if left < x2 and left + day_width > x1:
+                for entry in self.entries(index, y1, y2):
+                    visible.append((entry, self.event_rect(entry, index, width)))
+
+        for entry, (x, y, w, h) in visible:
+            ctx.set_source_rgb(*entry[0].color)
+            roundedrect(ctx, x, y, w, h, min(6, w / 2, h / 2))
+            ctx.fill()
+
+        ctx.set_source_rgb(0, 0, 0)
+        for entry, (x, y, w, h) in visible:
+            if w < MIN_TITLE_WIDTH or h < EVENT_HEIGHT:
+                continue
+            title = truncate_text(ctx, FONT_NORMAL, FONT_SIZE_EVENT, entry[0].title,
+                                  w - 2 * PADDING_TITLE)
+            ctx.move_to(x + PADDING_TITLE, y + 11)
+            ctx.show_text(title)
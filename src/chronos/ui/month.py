@@ -1,14 +1,16 @@
-import time
 import cairo
 import calendar
-from operator import itemgetter
-from collections import defaultdict
 
 from gi.repository import GObject as gobject, Gtk as gtk, Gdk as gdk
 
 from chronos.utils import datetime, iter_month_dates, number_of_weeks, \
-                          iter_date_range, first_day_of_week, \
-                          last_day_of_week
+                          month_ordinals, LRUCache
+from chronos.layout import LayoutEngine, week_start
+from chronos.ui.utils import text_extents, truncate_text
+from chronos.ui.bars import lane_top, lane_at, draw_bar, \
+                            calculate_remaining_space, PADDING_TITLE_LEFT, \
+                            TITLE_BASELINE
+from chronos.profiling import timed
 
 
 MONTH_YEAR_TEMPLATE = '%B %Y' # e.g. June 2011
@@ -29,40 +31,9 @@ PADDING_LEFT = 5
 PADDING_RIGHT = 5
 PADDING_DAY = 5
 PADDING_TITLE = 3
-PADDING_TITLE_LEFT = 8
-PADDING_EVENT = 3
-PADDING_START = 5
-PADDING_END = 5
-
-EVENT_HEIGHT = 15
-
-
-def roundedrect(ctx, x, y, w, h, r = 15, left=True, right=True):
-    "Draw a rounded rectangle"
-    #   A****BQ
-    #  H      C
-    #  *      *
-    #  G      D
-    #  PF****E
-
-    ctx.move_to(x+r,y)                      # Move to A
-    if right:
-        ctx.line_to(x+w-r,y)                # Straight line to B
-        ctx.curve_to(x+w,y,x+w,y,x+w,y+r)       # Curve to C, Control points are both at Q
-        ctx.line_to(x+w,y+h-r)                  # Move to D
-        ctx.curve_to(x+w,y+h,x+w,y+h,x+w-r,y+h) # Curve to E
-    else:
-        ctx.line_to(x+w,y)                    # Straight line to Q
-        ctx.line_to(x+w, y+h)                 # Straight line to E
-
-    if left:
-        ctx.line_to(x+r,y+h)                    # Line to F
-        ctx.curve_to(x,y+h,x,y+h,x,y+h-r)       # Curve to G
-        ctx.line_to(x,y+r)                      # Line to H
-        ctx.curve_to(x,y,x,y,x+r,y)             # Curve to A
-    else:
-        ctx.line_to(x,y+h)                    # Straight line to P
-        ctx.line_to(x, y)                     # Straight line to A
+
+# Number of months whose cells are kept around
+MONTH_CACHE_SIZE = 12
 
 
 class MonthView(gtk.DrawingArea):
@@ -79,111 +50,165 @@ class MonthView(gtk.DrawingArea):
         gtk.DrawingArea.__init__(self)
 
         self.date = date
+        self.selected_date = None
+        self.hover_cell = None
 
-        self.cells = []
-        for column in range(7):
-            self.cells.append([])
-            for row in range(7):
-                self.cells[column].append({})
-
-        self._events = {}
+        self.layout = LayoutEngine()
         self.grid_origin = (0, 0)
 
+        self.month_cache = LRUCache(MONTH_CACHE_SIZE)
+        self._prefetch_source = None
+        self.static_layers = None
+        self.cells = self.get_cells(self.date.year, self.date.month)
+
         self.set_size_request(800, 600)
-        self.set_events(self.get_events() | gdk.EventMask.BUTTON_PRESS_MASK)
+        self.set_has_tooltip(True)
+        self.set_events(self.get_events() |
+                        gdk.EventMask.BUTTON_PRESS_MASK |
+                        gdk.EventMask.POINTER_MOTION_MASK |
+                        gdk.EventMask.LEAVE_NOTIFY_MASK)
 
         self.connect('draw', self.draw)
         self.connect('size-allocate', lambda *x: self.calculate_cell_data())
         self.connect('button-press-event', self.button_press_cb)
+        self.connect('motion-notify-event', self.motion_notify_cb)
+        self.connect('leave-notify-event', self.leave_notify_cb)
+        self.connect('query-tooltip', self.query_tooltip_cb)
 
 
-    @property
-    def events(self):
-        """
-        Yields events in current month
-        """
+    def add_events(self, events):
 
-        def get_date_range(event):
-            for date in iter_date_range(event.start, event.end):
-               if date.year == self.date.year and date.month == self.date.month:
-                    yield date
+        weeks = set()
+        for event in events:
+            weeks.update(self.layout.add(event))
 
-        events_by_date = defaultdict(list)
-        for event in self._events.itervalues():
-            if not event.active: continue
+        self.update_cell_events(weeks)
+        self.queue_draw_weeks(weeks)
 
-            position = [0] # every value in this list is the position in each row the event spawns
-            dates = []
-            for i, date in enumerate(get_date_range(event)):
-                if date.first_day_of_week and i != 0:
-                    for d in dates:
-                        events_by_date[d.as_date].append((event, position[-1]))
-                    position.append(0) # new row
-                    dates = []
-                dates.append(date)
-                other_events = filter(lambda e: e != event and event_on_date(e, date) and e.active, self._events.itervalues())
-                for j, other_event in enumerate(other_events):
+    def remove_events(self, events):
 
-                    size_1, size_2 = rel_event_size_in_week(event, other_event, date)
+        weeks = set()
+        for event in events:
+            weeks.update(self.layout.remove(event))
 
-                    if size_1 == size_2:
-                        # if they are equally sized then sort after the title
-                        if event.title > other_event.title:
-                            position[-1] += 1
-                    elif size_1 < size_2:
-                        if position[-1] <= j:
-                            position[-1] += 1
+        self.update_cell_events(weeks)
+        self.queue_draw_weeks(weeks)
 
-            for d in dates:
-                events_by_date[d.as_date].append((event, position[-1]))
 
-        return events_by_date
+    def update_events(self, events):
 
+        weeks = set()
+        for event in events:
+            weeks.update(self.layout.update(event))
 
-    def add_events(self, events):
+        self.update_cell_events(weeks)
+        self.queue_draw_weeks(weeks)
 
-        for event in events:
-            self._events[event.uid] = event
 
-        self.update_cell_events()
-        self.queue_draw()
+    def set_calendar_visible(self, calendar_uid, visible):
 
-    def remove_events(self, events):
+        weeks = self.layout.set_visible(calendar_uid, visible)
 
-        for event in events:
-            self._events.pop(event.uid)
+        self.update_cell_events(weeks)
+        self.queue_draw_weeks(weeks)
 
-        self.update_cell_events()
-        self.queue_draw()
 
+    def queue_draw_weeks(self, weeks):
+        """
+        Queues a redraw of the rows showing one of ``weeks``, given as
+        ordinals of their mondays.
+        """
+
+        for row in range(len(self.cells[0])):
+            if self.cells[0][row]['date'].toordinal() in weeks:
+                self.queue_draw_area(*self.row_rect(row))
 
-    def update_events(self, events):
 
-        for event in events:
-            self._events[event.uid] = event
+    def queue_draw_cell(self, column, row):
+
+        cell = self.cells[column][row]
+        self.queue_draw_area(cell['x'], cell['y'], cell['width'] + 1, cell['height'] + 1)
 
-        self.update_cell_events()
-        self.queue_draw()
+
+    def row_rect(self, row):
+        """Returns the rectangle covered by the given row."""
+
+        first = self.cells[0][row]
+        last = self.cells[6][row]
+        width = last['x'] + last['width'] - first['x']
+        return first['x'], first['y'], width + 1, first['height'] + 1
 
 
     def set_date(self, date):
 
         self.date = date
-        self.calculate_cell_data()
-        self.update_cell_events()
+        self.cells = self.get_cells(self.date.year, self.date.month)
+        self.static_layers = None
+        self.hover_cell = None
+
         self.queue_draw()
 
+        if self._prefetch_source is None:
+            self._prefetch_source = gobject.idle_add(self.prefetch_cb)
+
 
-    def update_cell_events(self):
+    def prefetch_cb(self):
+        """Computes the cells of the previous and the next month."""
 
-        events = self.events
-        for row in self.cells:
-            for cell in row:
-                if 'date' in cell:
-                    cell['events'] = sorted(events[cell['date']], key=itemgetter(1))
+        self._prefetch_source = None
+
+        for date in (self.date.previous_month, self.date.next_month):
+            self.get_cells(date.year, date.month)
+
+        return False
+
+
+    def get_cells(self, year, month):
+        """
+        Returns the cells of the given month, computing them only if they
+        are not cached already.
+        """
+
+        cells = self.month_cache.get((year, month))
+        if cells is None:
+            cells = self.month_cache[(year, month)] = self.build_cells(year, month)
+        return cells
+
+
+    @timed('month.update_cell_events')
+    def update_cell_events(self, weeks=None):
+        """
+        Refreshes the events of all cells or only of those cells lying in
+        ``weeks``, given as ordinals of their mondays. Cached months
+        containing any of these weeks are dropped.
+        """
+
+        current = (self.date.year, self.date.month)
+        for key in list(self.month_cache):
+            if key != current and (weeks is None or month_in_weeks(key, weeks)):
+                self.month_cache.pop(key)
+
+        for column in self.cells:
+            for cell in column:
+                ordinal = cell['date'].toordinal()
+                if weeks is None or week_start(ordinal) in weeks:
+                    cell['events'] = self.layout.on(ordinal)
 
 
     def calculate_cell_data(self):
+        """Recalculates the cells of the current month, e.g. after resizing."""
+
+        self.month_cache.clear()
+        self.cells = self.get_cells(self.date.year, self.date.month)
+        self.static_layers = None
+
+
+    @timed('month.build_cells')
+    def build_cells(self, year, month):
+        """
+        Returns a grid (indexed by column and row) of cells for the given
+        month holding their geometry, date and events.
+        """
 
         width = self.get_allocation().width
         height = self.get_allocation().height
@@ -191,59 +216,252 @@ class MonthView(gtk.DrawingArea):
         x, y = self.grid_origin
 
         grid_height = height - y - PADDING_BOTTOM
-        num_weeks = number_of_weeks(self.date.year, self.date.month)
+        num_weeks = number_of_weeks(year, month)
         cell_height = grid_height / float(num_weeks)
         cell_width = (width - PADDING_LEFT - PADDING_RIGHT) / 7.0
 
-        monthdates = iter_month_dates(self.date.year, self.date.month)
+        monthdates = iter_month_dates(year, month)
+
+        cells = [[] for column in range(7)]
 
         y2 = y
         for row in range(num_weeks):
             x2 = x
             for column in range(7):
-                d = self.cells[column][row]
-                d['x'] = int(x2)
-                d['y'] = int(y2)
-                d['width'] = int(cell_width)
-                d['height'] = int(cell_height)
-                d['date'] = monthdates.next()
-                if not 'selected' in d:
-                    d['selected'] = False
+                date = monthdates.next()
+                cells[column].append({
+                    'x': int(x2),
+                    'y': int(y2),
+                    'width': int(cell_width),
+                    'height': int(cell_height),
+                    'date': date,
+                    'events': self.layout.on(date.toordinal())
+                })
                 x2 += cell_width
             y2 += cell_height
 
+        return cells
+
+
+    def cell_at(self, x, y):
+        """
+        Returns the column and row of the cell at ``x``, ``y`` or ``None``.
+        """
+
+        width = self.get_allocation().width
+        height = self.get_allocation().height
+
+        x0, y0 = self.grid_origin
+        num_weeks = len(self.cells[0])
+        cell_width = (width - PADDING_LEFT - PADDING_RIGHT) / 7.0
+        cell_height = (height - y0 - PADDING_BOTTOM) / float(num_weeks)
+
+        if x <= x0 or y <= y0 or cell_width <= 0 or cell_height <= 0:
+            return None
+
+        column = int((x - x0) // cell_width)
+        row = int((y - y0) // cell_height)
+        if column < 7 and row < num_weeks:
+            return column, row
+        return None
+
+
+    def cell_of(self, date):
+        """
+        Returns the column and row of the cell showing ``date`` or ``None``.
+        """
+
+        if date is None:
+            return None
+
+        ordinals = month_ordinals(self.date.year, self.date.month)
+        i = date.toordinal() - ordinals[0]
+        if 0 <= i < len(ordinals):
+            return i % 7, i // 7
+        return None
+
+
+    def event_at(self, x, y):
+        """Returns the event whose bar is at ``x``, ``y`` or ``None``."""
+
+        position = self.cell_at(x, y)
+        if position is None:
+            return None
+
+        if self.static_layers is None:
+            return None
+
+        cell = self.cells[position[0]][position[1]]
+        ctx = cairo.Context(self.static_layers[0])
+
+        lane = lane_at(cell['y'] + day_height(ctx, cell['date']) + PADDING_DAY, y)
+        if lane is None:
+            return None
+
+        for event, pos in cell['events']:
+            if pos == lane:
+                return event
+            if pos > lane:
+                break
+        return None
+
 
     def button_press_cb(self, widget, event):
 
-        x, y = event.x, event.y
+        previous = self.cell_of(self.selected_date)
+        position = self.cell_at(event.x, event.y)
 
-        should_redraw = False
-        num_weeks = number_of_weeks(self.date.year, self.date.month)
-        for column in range(7):
-            for row in range(num_weeks):
-                c_x = self.cells[column][row]['x']
-                c_y = self.cells[column][row]['y']
-                c_w = self.cells[column][row]['width']
-                c_h = self.cells[column][row]['height']
+        if position is None:
+            self.selected_date = None
+        else:
+            self.selected_date = self.cells[position[0]][position[1]]['date']
+
+        if position != previous:
+            for cell in (previous, position):
+                if cell is not None:
+                    self.queue_draw_cell(*cell)
+
+        if position is not None:
+            self.emit('day-selected', self.selected_date)
+
+
+    def motion_notify_cb(self, widget, event):
+
+        position = self.cell_at(event.x, event.y)
+        if position != self.hover_cell:
+            for cell in (self.hover_cell, position):
+                if cell is not None:
+                    self.queue_draw_cell(*cell)
+            self.hover_cell = position
+
+
+    def leave_notify_cb(self, widget, event):
+
+        if self.hover_cell is not None:
+            self.queue_draw_cell(*self.hover_cell)
+            self.hover_cell = None
+
+
+    def query_tooltip_cb(self, widget, x, y, keyboard_mode, tooltip):
 
-                if (in_rect(x, y, c_x, c_y, c_w, c_h)):
-                    self.cells[column][row]['selected'] = True
-                    self.emit('day-selected', self.cells[column][row]['date'])
-                    should_redraw = True
-                else:
-                    self.cells[column][row]['selected'] = False
+        event = self.event_at(x, y)
+        if event is None:
+            return False
 
-        if should_redraw:
-            self.queue_draw()
+        text = event.title
+        if event.location:
+            text += '\n' + event.location
+        tooltip.set_text(text)
+        return True
 
 
+    @timed('month.draw')
     def draw(self, widget, ctx):
 
         width = self.get_allocation().width
         height = self.get_allocation().height
 
+        if self.static_layers is None:
+            self.static_layers = self.render_static_layers(ctx.get_target(), width, height)
+        background, grid = self.static_layers
+
         ctx.set_operator(cairo.OPERATOR_OVER)
 
+        ctx.set_source_surface(background, 0, 0)
+        ctx.paint()
+
+        # Only the cells and rows intersecting the dirty region are drawn
+        clip = ctx.clip_extents()
+
+        self.draw_events(ctx, clip)
+
+        ctx.set_source_surface(grid, 0, 0)
+        ctx.paint()
+
+        self.draw_titles(ctx, clip)
+
+
+    @timed('month.draw.events')
+    def draw_events(self, ctx, clip):
+
+        num_weeks = number_of_weeks(self.date.year, self.date.month)
+        for column in range(7):
+            for row in range(num_weeks):
+                x = self.cells[column][row]['x']
+                y = self.cells[column][row]['y']
+                cell_width = self.cells[column][row]['width']
+                cell_height = self.cells[column][row]['height']
+
+                if not intersects(clip, x, y, cell_width + 1, cell_height + 1):
+                    continue
+
+                date = self.cells[column][row]['date']
+                events = self.cells[column][row]['events']
+
+                if date == self.selected_date:
+                    ctx.set_source_rgba(0, 0, 0.5, 0.1)
+                    ctx.rectangle(x, y, cell_width+1, cell_height+1)
+                    ctx.fill()
+                elif (column, row) == self.hover_cell:
+                    ctx.set_source_rgba(0, 0, 0.5, 0.04)
+                    ctx.rectangle(x, y, cell_width+1, cell_height+1)
+                    ctx.fill()
+
+                y2 = y + day_height(ctx, date) + PADDING_DAY
+
+                # Draw events
+                ordinal = date.toordinal()
+                for event, pos in events:
+                    ctx.set_source_rgb(*event.color)
+
+                    draw_bar(ctx, event, ordinal, x, lane_top(y2, pos), cell_width)
+                    ctx.fill()
+
+
+    @timed('month.draw.titles')
+    def draw_titles(self, ctx, clip):
+
+        ctx.select_font_face(*FONT_NORMAL)
+        ctx.set_font_size(FONT_SIZE_DAY)
+        ctx.set_source_rgb(0, 0, 0)
+
+        num_weeks = number_of_weeks(self.date.year, self.date.month)
+        rows = [row for row in range(num_weeks)
+                if intersects(clip, *self.row_rect(row))]
+
+        for column in range(7):
+            for row in rows:
+                x = self.cells[column][row]['x']
+                y = self.cells[column][row]['y']
+                cell_width = self.cells[column][row]['width']
+                date = self.cells[column][row]['date']
+                events = self.cells[column][row]['events']
+
+                y2 = y + day_height(ctx, date) + PADDING_DAY
+
+                ordinal = date.toordinal()
+                for event, pos in events:
+                    if ordinal == event.start_ordinal or date.first_day_of_week:
+                        space = calculate_remaining_space(event, ordinal, cell_width)
+
+                        title = truncate_text(ctx, FONT_NORMAL, FONT_SIZE_DAY, event.title, space)
+
+                        ctx.move_to(x + PADDING_TITLE_LEFT, lane_top(y2, pos) + TITLE_BASELINE)
+                        ctx.show_text(title)
+
+
+    @timed('month.draw.static_layers')
+    def render_static_layers(self, target, width, height):
+        """
+        Renders everything which only changes with the size or the date of
+        the view. Returns two surfaces: the background with the weekdays,
+        the shading of days outside the month and the day numbers, and the
+        grid which is drawn on top of the events.
+        """
+
+        background = target.create_similar(cairo.CONTENT_COLOR, width, height)
+        ctx = cairo.Context(background)
+
         # clear background
         ctx.set_source_rgb(255, 255, 255)
         ctx.rectangle(0, 0, width, height)
@@ -261,7 +479,7 @@ class MonthView(gtk.DrawingArea):
         for i, weekday in enumerate(calendar.Calendar().iterweekdays()):
             dayname = calendar.day_name[weekday]
 
-            _, _, t_width, t_height = get_text_extents(ctx, dayname)
+            _, _, t_width, t_height = get_text_extents(ctx, FONT_NORMAL, FONT_SIZE_WEEKDAY, dayname)
             x = i * cell_width + cell_width/2 - t_width/2
             y = max(y, t_height + PADDING_TOP)
 
@@ -271,8 +489,9 @@ class MonthView(gtk.DrawingArea):
         if self.grid_origin != (PADDING_LEFT, y + PADDING):
             self.grid_origin = (PADDING_LEFT, y + PADDING)
             self.calculate_cell_data()
-        else:
-            self.grid_origin = (PADDING_LEFT, y + PADDING)
+
+        ctx.select_font_face(*FONT_NORMAL)
+        ctx.set_font_size(FONT_SIZE_DAY)
 
         num_weeks = number_of_weeks(self.date.year, self.date.month)
         for column in range(7):
@@ -282,8 +501,6 @@ class MonthView(gtk.DrawingArea):
                 cell_width = self.cells[column][row]['width']
                 cell_height = self.cells[column][row]['height']
                 date = self.cells[column][row]['date']
-                events = self.cells[column][row]['events']
-                selected = self.cells[column][row]['selected']
 
                 if date.month != self.date.month:
                     # Draw the day grey, it sucks!
@@ -291,47 +508,24 @@ class MonthView(gtk.DrawingArea):
                     ctx.rectangle(x, y, cell_width+1, cell_height+1)
                     ctx.fill()
 
-                if selected:
-                    ctx.set_source_rgba(0, 0, 0.5, 0.1)
-                    ctx.rectangle(x, y, cell_width+1, cell_height+1)
-                    ctx.fill()
-
                 # Draw the day into the right upper corner
                 ctx.set_source_rgba(*COLOR_GREY)
-                ctx.select_font_face(*FONT_NORMAL)
-                ctx.set_font_size(FONT_SIZE_DAY)
 
-                _, _, t_width, t_height = get_text_extents(ctx, str(date.day))
+                _, _, t_width, t_height = get_text_extents(ctx, FONT_NORMAL, FONT_SIZE_DAY, str(date.day))
                 x2 = x + cell_width - t_width - PADDING_DAY
                 y2 = y + t_height + PADDING_DAY
                 ctx.move_to(x2, y2)
                 ctx.show_text(str(date.day))
 
-                # Draw events
-                for event, pos in events:
-                    ctx.set_source_rgb(*event.color)
+        grid = target.create_similar(cairo.CONTENT_COLOR_ALPHA, width, height)
+        ctx = cairo.Context(grid)
 
-                    y3 = int(y2 + PADDING_EVENT + pos * (EVENT_HEIGHT + PADDING_EVENT))
-
-                    if (event.start.as_date == date.as_date and
-                        event.end.as_date == date.as_date):
-                        roundedrect(ctx, x+PADDING_START, y3, cell_width-(PADDING_START+PADDING_END), EVENT_HEIGHT, 8)
-                    elif event.start.as_date == date.as_date:
-                        roundedrect(ctx, x+PADDING_START, y3, cell_width-(PADDING_START-1), EVENT_HEIGHT, 8, right=False)
-                    elif event.end.as_date == date.as_date:
-                        roundedrect(ctx, x, y3, cell_width-PADDING_END, EVENT_HEIGHT, 8, left=False)
-                    else:
-                        ctx.rectangle(x, y3, cell_width+1, EVENT_HEIGHT)
-
-                    ctx.fill()
+        ctx.set_source_rgba(.8, .8, .8, 1)
+        ctx.set_line_width(1)
 
-        # Draw grid
         def draw_line(ctx, x1, y1, x2, y2):
-            ctx.set_source_rgba(.8, .8, .8, 1)
-            ctx.set_line_width(1)
             ctx.move_to(int(x1) + .5, int(y1) + .5)
             ctx.line_to(int(x2) + .5, int(y2) + .5)
-            ctx.stroke()
 
         for column in range(7):
             for row in range(num_weeks):
@@ -354,118 +548,37 @@ class MonthView(gtk.DrawingArea):
                 y = int(y + cell_height)
                 draw_line(ctx, x, y, width - PADDING_RIGHT, y)
 
+        ctx.stroke()
 
-        # Draw event titles
-        ctx.select_font_face(*FONT_NORMAL)
-        ctx.set_font_size(FONT_SIZE_DAY)
-        ctx.set_source_rgb(0, 0, 0)
-
-        for column in range(7):
-            for row in range(num_weeks):
-                x = self.cells[column][row]['x']
-                y = self.cells[column][row]['y']
-                cell_width = self.cells[column][row]['width']
-                date = self.cells[column][row]['date']
-                events = self.cells[column][row]['events']
+        return background, grid
 
-                t_height = get_text_extents(ctx, str(date.day))[3]
 
-                y2 = y + t_height + PADDING_DAY
-
-                for event, pos in events:
-                    y3 = int(y2 + PADDING_EVENT + pos * (EVENT_HEIGHT + PADDING_EVENT))
-                    if date == event.start.as_date or date.first_day_of_week:
-                        space = calculate_remaining_space(event, date, cell_width)
-
-                        title = event.title
-                        t_width = get_text_extents(ctx, title)[2]
-                        while t_width > space and len(title) > 1:
-                            title = title[:-1]
-                            t_width = get_text_extents(ctx, title)[2]
-
-                        ctx.move_to(x + PADDING_TITLE_LEFT, y3 + 11)
-                        ctx.show_text(title)
-
-
-def event_on_date(event, date):
-
-    for d in iter_date_range(event.start, event.end):
-        if d == date.as_date:
-            return True
-
-    return False
-
-
-def rel_event_size_in_week(event1, event2, date):
+def month_in_weeks(key, weeks):
     """
-    Returns the relative size of two events in the week containing date.
+    Returns whether the weeks displayed for the month ``key``, a
+    ``(year, month)`` tuple, contain one of ``weeks``.
     """
 
-    weekstart = first_day_of_week(date)
-    weekend = last_day_of_week(date)
-
-    if event1.start < weekstart:
-        event1_start = weekstart
-    else:
-        event1_start = event1.start
-
-    if event2.start < weekstart:
-        event2_start = weekstart
-    else:
-        event2_start = event2.start
-
-    if event1.end > weekend:
-        event1_end = weekend
-    else:
-        event1_end = event1.end
-
-    if event2.end > weekend:
-        event2_end = weekend
-    else:
-        event2_end = event2.end
-
-
-    if event1_start > event2_start:
-        start = event1_start
-    else:
-        start = event2_start
-
+    ordinals = month_ordinals(*key)
+    first, last = ordinals[0], ordinals[-1]
+    for week in weeks:
+        if first <= week <= last:
+            return True
+    return False
 
-    return (event1_end - start), (event2_end - start)
 
+def get_text_extents(ctx, font, size, text):
+    return text_extents(ctx, font, size, text)[:4]
 
-def get_text_extents(ctx, text):
-    return ctx.text_extents(text)[:4]
 
+def day_height(ctx, date):
+    """Returns the height of the day number drawn into the cell of ``date``."""
+    return text_extents(ctx, FONT_NORMAL, FONT_SIZE_DAY, str(date.day))[3]
 
-def in_rect(x, y, x0, y0, w, h):
-    """
-    Returns if x and y are in the rectangle specified by x0, y0, w, h
-    """
-    return x > x0 and x < x0 + w and y > y0 and y < y0 + h
 
-def calculate_remaining_space(event, date, width):
+def intersects(clip, x, y, w, h):
     """
-    Returns the remaining space for the event title for the row which contains date
+    Returns if the rectangle specified by x, y, w, h intersects ``clip``,
+    given as extents (x1, y1, x2, y2).
     """
-    start = first_day_of_week(date)
-    end = last_day_of_week(date)
-
-    if event.start.as_date == end.as_date:
-        return width
-
-    if event.start.as_date > start.as_date:
-        start = event.start
-    else:
-        width -= 2*PADDING_START
-    if event.end.as_date < end:
-        end = event.end
-    else:
-        width -= PADDING_END
-
-    width -= PADDING_TITLE_LEFT
-
-    remaining_space = 0
-    for date in iter_date_range(start, end):
-        remaining_space += width
-    return remaining_space
+    return x < clip[2] and x + w > clip[0] and y < clip[3] and y + h > clip[1]
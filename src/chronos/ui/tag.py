@@ -1,9 +1,18 @@
 from gi.repository import Gtk as gtk, Gdk as gdk, GObject as gobject
 import cairo
-from math import pi
+from math import pi, ceil
 import colorsys
 
-from cream.gui import Timeline, CURVE_SINE
+from chronos.ui.utils import text_extents
+from chronos.ui.animation import Animator
+
+FONT = ('Droid Sans', cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_NORMAL)
+FONT_SIZE = 12
+HEIGHT = 32
+
+# Labels are measured before the tag is drawn for the first time
+_measure_context = cairo.Context(cairo.ImageSurface(cairo.FORMAT_ARGB32, 1, 1))
+
 
 # TODO: Move to chronos.ui.util
 def darken(r, g, b):
@@ -26,12 +35,18 @@ class Tag(gtk.DrawingArea, gobject.GObject):
 
     def __init__(self, uid, label, color, active):
 
+        self._label = None
+        self._color = None
+        self._layers = {}
+
         self.active = active
         self.alpha = .5
 
         gtk.DrawingArea.__init__(self)
         gobject.GObject.__init__(self)
 
+        self.animator = Animator(self)
+
         self.set_events(self.get_events() |
                         gdk.EventMask.BUTTON_PRESS_MASK |
                         gdk.EventMask.ENTER_NOTIFY_MASK |
@@ -40,52 +55,102 @@ class Tag(gtk.DrawingArea, gobject.GObject):
         self.connect('enter-notify-event', self.mouse_enter_cb)
         self.connect('leave-notify-event', self.mouse_leave_cb)
         self.connect('draw', self.draw_cb)
-
-        self.set_property('height-request', 32)
+        # A tag removed while fading must not keep its tick callback
+        self.connect('unrealize', lambda tag: self.animator.stop())
 
         self.uid = uid
         self.label = label
         self.color = color
 
 
-    def draw_cb(self, drawing_area, ctx):
+    @property
+    def label(self):
+        return self._label
 
-        ctx.select_font_face("Droid Sans", cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_NORMAL)
-        ctx.set_font_size(12)
+    @label.setter
+    def label(self, label):
 
-        t_xbearing, t_ybearing, t_width, t_height, t_xadvance, t_yadvance = ctx.text_extents(self.label)
+        if label != self._label:
+            self._label = label
+            self.extents = text_extents(_measure_context, FONT, FONT_SIZE, label)
+            self._layers.clear()
+            self.queue_resize()
 
-        width = t_width + 45
-        height = self.get_preferred_height()[0]
 
-        self.set_size_request(width, height)
+    @property
+    def color(self):
+        return self._color
 
-        ctx.save()
-        ctx.set_fill_rule(cairo.FILL_RULE_EVEN_ODD)
-        ctx.set_line_width(1)
-        ctx.translate(.5, .5)
+    @color.setter
+    def color(self, color):
+
+        if color != self._color:
+            self._color = color
+            self._layers.clear()
+            self.queue_draw()
+
+
+    def do_get_preferred_width(self):
+
+        width = int(ceil(self.extents[2])) + 45
+        return width, width
+
+
+    def do_get_preferred_height(self):
+        return HEIGHT, HEIGHT
+
+
+    def get_layers(self, target, width, height):
+        """
+        Returns the cached fill and outline layers of the tag in its current
+        state, rendering them first if the size, label, color or state
+        changed. The fill is painted with the current alpha.
+        """
+
+        key = (self.active, width, height)
+        layers = self._layers.get(key)
+        if layers is not None:
+            return layers
+
+        # Only the layers of the current size are worth keeping
+        for cached in self._layers.keys():
+            if cached[1:] != (width, height):
+                del self._layers[cached]
+
+        fill = target.create_similar(cairo.CONTENT_COLOR_ALPHA, width, height)
+        outline = target.create_similar(cairo.CONTENT_COLOR_ALPHA, width, height)
+
+        def shape(ctx):
+            ctx.set_fill_rule(cairo.FILL_RULE_EVEN_ODD)
+            ctx.set_line_width(1)
+            ctx.translate(.5, .5)
 
-        ctx.move_to(5, 6)
-        ctx.line_to(width-18, 6)
-        ctx.line_to(width-10, 6 + (height-12)*1.0/3.0)
-        ctx.line_to(width-10, 6 + (height-12)*2.0/3.0)
-        ctx.line_to(width-18, height-6)
-        ctx.line_to(5, height-6)
-        ctx.line_to(5, 6)
+            ctx.move_to(5, 6)
+            ctx.line_to(width-18, 6)
+            ctx.line_to(width-10, 6 + (height-12)*1.0/3.0)
+            ctx.line_to(width-10, 6 + (height-12)*2.0/3.0)
+            ctx.line_to(width-18, height-6)
+            ctx.line_to(5, height-6)
+            ctx.line_to(5, 6)
 
-        ctx.new_sub_path()
-        ctx.arc(width - 16, height/2.0, 3, 0, 2*pi)
+            ctx.new_sub_path()
+            ctx.arc(width - 16, height/2.0, 3, 0, 2*pi)
 
+        ctx = cairo.Context(fill)
+        shape(ctx)
         if not self.active:
-            ctx.set_source_rgba(0.6, 0.6, 0.6, self.alpha)
+            ctx.set_source_rgb(0.6, 0.6, 0.6)
         else:
-            ctx.set_source_rgba(self.color[0], self.color[1], self.color[2], self.alpha)
-        ctx.fill_preserve()
+            ctx.set_source_rgb(*self.color)
+        ctx.fill()
 
+        ctx = cairo.Context(outline)
+        ctx.save()
+        shape(ctx)
         if self.active:
             ctx.set_source_rgb(*darken(*self.color))
         else:
-            ctx.set_source_rgba(0.3, 0.3, 0.3, self.alpha)
+            ctx.set_source_rgb(0.3, 0.3, 0.3)
         ctx.stroke()
         ctx.restore()
 
@@ -99,43 +164,47 @@ class Tag(gtk.DrawingArea, gobject.GObject):
         ctx.stroke()
         ctx.restore()
 
-        ctx.move_to(16-t_xbearing, (self.get_preferred_height()[0] - t_ybearing) / 2.0)
+        t_xbearing, t_ybearing = self.extents[:2]
+        ctx.select_font_face(*FONT)
+        ctx.set_font_size(FONT_SIZE)
+        ctx.move_to(16-t_xbearing, (height - t_ybearing) / 2.0)
         if not self.active:
-            ctx.set_source_rgba(0.2, 0.2, 0.2, self.alpha)
+            ctx.set_source_rgb(0.2, 0.2, 0.2)
         ctx.show_text(self.label)
-        ctx.stroke()
 
-    def button_press_cb(self, tag, event):
+        layers = self._layers[key] = (fill, outline)
+        return layers
 
-        self.active = not self.active
-        self.emit('activity-changed', self.active)
 
-        def update(t, state):
-            self.alpha = .5  + state*.5
-            self.queue_draw()
+    def draw_cb(self, drawing_area, ctx):
 
-        t = Timeline(200, CURVE_SINE)
-        t.connect('update', update)
-        t.run()
+        width = self.get_allocated_width()
+        height = self.get_allocated_height()
 
+        fill, outline = self.get_layers(ctx.get_target(), width, height)
 
-    def mouse_enter_cb(self, tag, event):
+        ctx.set_source_surface(fill)
+        ctx.paint_with_alpha(self.alpha)
 
-        def update(t, state):
-            self.alpha = .5  + state*.5
-            self.queue_draw()
+        # The outline of inactive tags fades with the fill
+        ctx.set_source_surface(outline)
+        if self.active:
+            ctx.paint()
+        else:
+            ctx.paint_with_alpha(self.alpha)
 
-        t = Timeline(200, CURVE_SINE)
-        t.connect('update', update)
-        t.run()
+    def button_press_cb(self, tag, event):
 
+        self.active = not self.active
+        self.emit('activity-changed', self.active)
 
-    def mouse_leave_cb(self, tag, event):
+        self.queue_draw()
+        self.animator.animate('alpha', 1, 200)
 
-        def update(t, state):
-            self.alpha = 1  - state*.5
-            self.queue_draw()
 
-        t = Timeline(300, CURVE_SINE)
-        t.connect('update', update)
-        t.run()
+    def mouse_enter_cb(self, tag, event):
+        self.animator.animate('alpha', 1, 200)
+
+
+    def mouse_leave_cb(self, tag, event):
+        self.animator.animate('alpha', .5, 300)
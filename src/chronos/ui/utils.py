@@ -1,5 +1,7 @@
 import colorsys
 
+from chronos.utils import LRUCache
+
 
 def find_colors(r, g, b):
 
@@ -11,3 +13,56 @@ def find_colors(r, g, b):
         c = (hsv[0] - offset, hsv[1], hsv[2])
         offset += 1.0/6
         yield colorsys.hsv_to_rgb(*c)
+
+
+# Extents and truncated strings, keyed by font, font size and text
+_extents = LRUCache(4096)
+_truncated = LRUCache(1024)
+
+
+def text_extents(ctx, font, size, text):
+    """
+    Returns the extents of ``text`` drawn in ``font``, a tuple as passed to
+    ``select_font_face``, with the given ``size``. The extents are cached,
+    so the context is only used if the text has not been measured before.
+    """
+
+    key = (font, size, text)
+    extents = _extents.get(key)
+    if extents is None:
+        ctx.save()
+        ctx.select_font_face(*font)
+        ctx.set_font_size(size)
+        extents = _extents[key] = ctx.text_extents(text)
+        ctx.restore()
+    return extents
+
+
+def truncate_text(ctx, font, size, text, width):
+    """
+    Returns the longest prefix of ``text`` which is at most ``width`` wide,
+    but at least its first character. ``width`` is rounded down to whole
+    pixels.
+    """
+
+    width = int(width)
+    key = (font, size, text, width)
+    truncated = _truncated.get(key)
+    if truncated is not None:
+        return truncated
+
+    if text_extents(ctx, font, size, text)[2] <= width:
+        truncated = text
+    else:
+        # bisect for the length of the longest fitting prefix
+        lo, hi = 1, len(text) - 1
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if text_extents(ctx, font, size, text[:mid])[2] <= width:
+                lo = mid
+            else:
+                hi = mid - 1
+        truncated = text[:lo]
+
+    _truncated[key] = truncated
+    return truncated
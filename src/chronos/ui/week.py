@@ -0,0 +1,195 @@
+import datetime as _datetime
+
+from gi.repository import GObject as gobject, Gtk as gtk, Gdk as gdk
+
+from chronos.utils import day
+from chronos.layout import week_start
+from chronos.ui.month import FONT_NORMAL, FONT_BOLD, FONT_SIZE_DAY, COLOR_GREY
+from chronos.ui.day import HourGrid, HOUR_GUTTER, PADDING
+from chronos.ui.bars import lane_top, draw_bar, calculate_remaining_space, \
+                            EVENT_HEIGHT, PADDING_EVENT, PADDING_TITLE_LEFT, \
+                            TITLE_BASELINE
+from chronos.ui.utils import text_extents, truncate_text
+from chronos.profiling import timed
+
+HEADER_HEIGHT = 24
+DAY_TEMPLATE = '%a %d'
+
+
+def is_timed(event):
+    """Returns whether ``event`` is shown in the hour grid of a week."""
+    return event.start_ordinal == event.end_ordinal
+
+
+class WeekView(gtk.VBox):
+    """
+    Shows seven days: events spanning several days or covering a whole day
+    as bars on top, the other events in an hour grid below.
+
+    The bars keep the lanes the month view computed for the week and the
+    hour grid uses day layouts of the events within a single day, all taken
+    from the ``LayoutEngine`` passed as ``layout``. Switching between the
+    views thus does not lay out anything again.
+    """
+
+    __gtype_name__ = 'WeekView'
+    __gsignals__ = {
+        'day-selected': (gobject.SignalFlags.RUN_LAST, None, (object,)),
+    }
+
+    def __init__(self, layout):
+
+        gtk.VBox.__init__(self)
+
+        self.layout = layout
+        self.week = None
+        self.sources = None
+
+        self.bars = WeekBars()
+        self.hours = HourGrid()
+
+        scrolled = gtk.ScrolledWindow()
+        scrolled.set_policy(gtk.PolicyType.NEVER, gtk.PolicyType.AUTOMATIC)
+        scrolled.add_with_viewport(self.hours)
+
+        self.bars.connect('day-selected', lambda bars, date: self.emit('day-selected', date))
+
+        self.pack_start(self.bars, False, False, 0)
+        self.pack_start(scrolled, True, True, 0)
+
+
+    def set_date(self, date):
+        """Shows the week containing ``date``."""
+
+        week = week_start(date.toordinal())
+        if week != self.week:
+            self.week = week
+            self.sources = None
+            self.refresh()
+
+
+    def refresh(self):
+        """
+        Fetches the layouts of the shown week again. Nothing is redrawn if
+        the events of the week did not change.
+        """
+
+        if self.week is None:
+            return
+
+        week = self.layout.week(self.week)
+        days = [self.layout.day(o, single_day=True) for o in range(self.week, self.week + 7)]
+
+        sources = [week] + days
+        if self.sources is not None and all(a is b for a, b in zip(sources, self.sources)):
+            return
+        self.sources = sources
+
+        all_day = set()
+        for d in days:
+            all_day.update(e.uid for e in d.all_day)
+
+        self.bars.set_segments(self.week, [s for s in week.segments
+                                           if not is_timed(s[0]) or s[0].uid in all_day])
+        self.hours.set_days(days)
+
+
+class WeekBars(gtk.DrawingArea):
+    """
+    The dates of a week and the bars of the events shown on top of the
+    hour grid.
+    """
+
+    __gtype_name__ = 'WeekBars'
+    __gsignals__ = {
+        'day-selected': (gobject.SignalFlags.RUN_LAST, None, (object,)),
+    }
+
+    def __init__(self):
+
+        gtk.DrawingArea.__init__(self)
+
+        self.week = None
+        self.segments = []
+
+        self.set_events(self.get_events() | gdk.EventMask.BUTTON_PRESS_MASK)
+
+        self.connect('draw', self.draw)
+        self.connect('button-press-event', self.button_press_cb)
+
+
+    def set_segments(self, week, segments):
+        """
+        Shows ``segments``, a subset of the segments of a ``WeekLayout``.
+        The lanes left empty by the omitted segments are closed up.
+        """
+
+        lanes = dict((lane, i) for i, lane in enumerate(sorted(set(s[1] for s in segments))))
+
+        self.week = week
+        self.segments = [(event, lanes[lane], first, last)
+                         for event, lane, first, last in segments]
+
+        height = HEADER_HEIGHT + len(lanes) * (EVENT_HEIGHT + PADDING_EVENT) + PADDING
+        self.set_size_request(-1, height)
+        self.queue_draw()
+
+
+    def day_width(self):
+        return (self.get_allocation().width - HOUR_GUTTER - PADDING) / 7.0
+
+
+    def button_press_cb(self, widget, event):
+
+        if self.week is None or event.y > HEADER_HEIGHT:
+            return
+
+        column = int((event.x - HOUR_GUTTER) // self.day_width())
+        if 0 <= column < 7:
+            self.emit('day-selected', day(self.week + column))
+
+
+    @timed('week.draw')
+    def draw(self, widget, ctx):
+
+        if self.week is None:
+            return
+
+        day_width = self.day_width()
+        today = _datetime.date.today().toordinal()
+
+        ctx.set_source_rgb(1, 1, 1)
+        ctx.paint()
+
+        # Dates
+        ctx.set_font_size(FONT_SIZE_DAY)
+        for column in range(7):
+            date = day(self.week + column)
+            text = date.strftime(DAY_TEMPLATE)
+            font = FONT_BOLD if date.toordinal() == today else FONT_NORMAL
+
+            ctx.select_font_face(*font)
+            x_bearing, y_bearing, t_width, t_height = text_extents(ctx, font, FONT_SIZE_DAY, text)[:4]
+            x = HOUR_GUTTER + column * day_width + (day_width - t_width) / 2.0 - x_bearing
+            ctx.set_source_rgba(*COLOR_GREY)
+            ctx.move_to(x, (HEADER_HEIGHT - y_bearing) / 2.0)
+            ctx.show_text(text)
+
+        # Bars
+        for event, lane, first, last in self.segments:
+            y = lane_top(HEADER_HEIGHT, lane)
+            ctx.set_source_rgb(*event.color)
+            for ordinal in range(first, last + 1):
+                x = int(HOUR_GUTTER + (ordinal - self.week) * day_width)
+                draw_bar(ctx, event, ordinal, x, y, int(day_width))
+            ctx.fill()
+
+        ctx.select_font_face(*FONT_NORMAL)
+        ctx.set_source_rgb(0, 0, 0)
+        for event, lane, first, last in self.segments:
+            x = int(HOUR_GUTTER + (first - self.week) * day_width)
+            space = calculate_remaining_space(event, first, int(day_width))
+            title = truncate_text(ctx, FONT_NORMAL, FONT_SIZE_DAY, event.title, space)
+
+            ctx.move_to(x + PADDING_TITLE_LEFT, lane_top(HEADER_HEIGHT, lane) + TITLE_BASELINE)
+            ctx.show_text(title)
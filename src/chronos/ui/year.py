@@ -0,0 +1,168 @@
+import calendar
+
+from gi.repository import GObject as gobject, Gtk as gtk, Gdk as gdk
+
+from chronos.utils import datetime, month_ordinals, days_in_month
+from chronos.occupancy import year_bounds
+from chronos.ui.month import FONT_BOLD, COLOR_GREY, intersects
+from chronos.ui.utils import text_extents
+from chronos.profiling import timed
+
+COLUMNS = 4
+ROWS = 3
+
+FONT_SIZE_MONTH = 12
+TITLE_HEIGHT = 20
+PADDING = 10
+PADDING_DAY = 1
+
+# Days are shaded in this color, the more events the darker
+COLOR_BUSY = (.2, .4, .75)
+
+
+def in_month(ordinal, year, month):
+    """Returns whether the day ``ordinal`` lies in the given month."""
+
+    first = datetime(year, month, 1).toordinal()
+    return first <= ordinal < first + days_in_month(year, month)
+
+
+class YearView(gtk.DrawingArea):
+    """
+    Shows the twelve months of a year with every day shaded by the number
+    of events on it. The counts come from ``layout``, the ``LayoutEngine``
+    of the month view, which keeps them up to date.
+    """
+
+    __gtype_name__ = 'YearView'
+    __gsignals__ = {
+        'date-selected': (gobject.SignalFlags.RUN_LAST, None, (object,)),
+    }
+
+    def __init__(self, layout):
+
+        gtk.DrawingArea.__init__(self)
+
+        self.layout = layout
+        self.year = None
+
+        self.set_events(self.get_events() | gdk.EventMask.BUTTON_PRESS_MASK)
+
+        self.connect('draw', self.draw)
+        self.connect('button-press-event', self.button_press_cb)
+
+
+    def set_year(self, year):
+
+        if year != self.year:
+            self.year = year
+            self.queue_draw()
+
+
+    def refresh(self):
+        self.queue_draw()
+
+
+    def month_rect(self, month):
+        """Returns the rectangle of ``month``, a number from 1 to 12."""
+
+        width = self.get_allocation().width
+        height = self.get_allocation().height
+
+        month_width = (width - PADDING) / float(COLUMNS)
+        month_height = (height - PADDING) / float(ROWS)
+        column, row = (month - 1) % COLUMNS, (month - 1) // COLUMNS
+
+        return (PADDING + column * month_width, PADDING + row * month_height,
+                month_width - PADDING, month_height - PADDING)
+
+
+    def day_size(self, month):
+
+        x, y, width, height = self.month_rect(month)
+        return width / 7.0, (height - TITLE_HEIGHT) / 6.0
+
+
+    def date_at(self, x, y):
+        """
+        Returns the day at ``x``, ``y``, the first day of the month if that
+        is its title, or ``None``.
+        """
+
+        for month in range(1, 13):
+            x1, y1, width, height = self.month_rect(month)
+            if not (x1 <= x < x1 + width and y1 <= y < y1 + height):
+                continue
+
+            if y < y1 + TITLE_HEIGHT:
+                return datetime(self.year, month, 1)
+
+            day_width, day_height = self.day_size(month)
+            column = int((x - x1) // day_width)
+            row = int((y - y1 - TITLE_HEIGHT) // day_height)
+            ordinals = month_ordinals(self.year, month)
+            i = row * 7 + column
+            if i < len(ordinals) and in_month(ordinals[i], self.year, month):
+                return datetime.fromordinal(ordinals[i])
+            return None
+        return None
+
+
+    def button_press_cb(self, widget, event):
+
+        if self.year is None:
+            return
+
+        date = self.date_at(event.x, event.y)
+        if date is not None:
+            self.emit('date-selected', date)
+
+
+    @timed('year.draw')
+    def draw(self, widget, ctx):
+
+        if self.year is None:
+            return
+
+        clip = ctx.clip_extents()
+
+        ctx.set_source_rgb(1, 1, 1)
+        ctx.paint()
+
+        counts = self.layout.year(self.year)
+        first = year_bounds(self.year)[0]
+        maximum = float(max(counts)) or 1.0
+
+        for month in range(1, 13):
+            x, y, width, height = self.month_rect(month)
+            if not intersects(clip, x, y, width, height):
+                continue
+
+            title = calendar.month_name[month]
+            ctx.select_font_face(*FONT_BOLD)
+            ctx.set_font_size(FONT_SIZE_MONTH)
+            ctx.set_source_rgba(*COLOR_GREY)
+            y_bearing = text_extents(ctx, FONT_BOLD, FONT_SIZE_MONTH, title)[1]
+            ctx.move_to(x, y + (TITLE_HEIGHT - y_bearing) / 2.0)
+            ctx.show_text(title)
+
+            month_first = datetime(self.year, month, 1).toordinal()
+            month_last = month_first + days_in_month(self.year, month) - 1
+
+            day_width, day_height = self.day_size(month)
+            for i, ordinal in enumerate(month_ordinals(self.year, month)):
+                if not month_first <= ordinal <= month_last:
+                    continue
+
+                x2 = x + (i % 7) * day_width
+                y2 = y + TITLE_HEIGHT + (i // 7) * day_height
+
+                count = counts[ordinal - first]
+                if count:
+                    ctx.set_source_rgba(COLOR_BUSY[0], COLOR_BUSY[1], COLOR_BUSY[2],
+                                        .15 + .85 * count / maximum)
+                else:
+                    ctx.set_source_rgba(0, 0, 0, .04)
+                ctx.rectangle(x2 + PADDING_DAY, y2 + PADDING_DAY,
+                              day_width - 2 * PADDING_DAY, day_height - 2 * PADDING_DAY)
+                ctx.fill()
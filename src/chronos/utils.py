@@ -1,7 +1,7 @@
 import calendar
 import datetime as _datetime
-
-from cream.util import flatten
+from bisect import bisect_left
+from collections import OrderedDict
 
 
 class datetime(_datetime.datetime):
@@ -35,7 +35,7 @@ class datetime(_datetime.datetime):
     @property
     def as_date(self):
 
-        return datetime(self.year, self.month, self.day)
+        return day(self.toordinal())
 
 
     @property
@@ -84,32 +84,61 @@ class datetime(_datetime.datetime):
         return datetime.from_datetime(next)
 
 
+# Interned day keys and month grids, see ``day`` and ``month_ordinals``
+_days = {}
+_month_ordinals = {}
+
+
+def day(ordinal):
+    """
+    Returns the ``datetime`` at midnight of the day with the given ordinal.
+    The same instance is returned for every call with the same ordinal.
+    """
+    try:
+        return _days[ordinal]
+    except KeyError:
+        d = _datetime.date.fromordinal(ordinal)
+        return _days.setdefault(ordinal, datetime(d.year, d.month, d.day))
+
+
+def month_ordinals(year, month):
+    """
+    Returns a tuple of the ordinals of all days of the complete weeks
+    covering the given month.
+    """
+    key = (year, month)
+    try:
+        return _month_ordinals[key]
+    except KeyError:
+        first = _datetime.date(year, month, 1).toordinal()
+        last = first + days_in_month(year, month) - 1
+        first -= (first + 6) % 7
+        last += 6 - (last + 6) % 7
+        return _month_ordinals.setdefault(key, tuple(range(first, last + 1)))
+
+
 def days_in_month(year, month):
     """
     Returns how many days the given month has.
     """
-    monthdays = calendar.monthcalendar(year, month)
-    return len(filter(lambda x: x > 0, flatten(monthdays)))
+    return calendar.monthrange(year, month)[1]
 
 
 def iter_month_dates(year, month):
     """
     Returns an iterator for one month and will iterate trough complete weeks.
     """
-    monthdates = calendar.Calendar().itermonthdates(year, month)
-    for monthday in monthdates:
-        yield datetime.from_date(monthday)
+    for ordinal in month_ordinals(year, month):
+        yield day(ordinal)
 
 
 def iter_date_range(start, end):
     """
     Returns an iterator which yields all dates between ``start`` and ``end``
     """
-    yield start.as_date
-    date = start
-    while date.as_date != end.as_date:
-        date = date.next_day
-        yield date.as_date
+    first = start.toordinal()
+    for ordinal in xrange(first, max(first, end.toordinal()) + 1):
+        yield day(ordinal)
 
 
 def first_day_of_week(date):
@@ -125,7 +154,135 @@ def last_day_of_week(date):
 
 def number_of_weeks(year, month):
     """Returns the number of weeks the given month has."""
-    return len(calendar.Calendar().monthdatescalendar(year, month))
+    return len(month_ordinals(year, month)) // 7
+
+
+def visible_dates(year, month):
+    """
+    Returns the first and the last date of the complete weeks covering the
+    given month.
+    """
+    ordinals = month_ordinals(year, month)
+    return day(ordinals[0]), day(ordinals[-1])
+
+
+class RangeSet(object):
+    """
+    A set of integers, stored as sorted and disjoint ranges. Used to keep
+    track of the day ordinals which have been loaded already.
+    """
+
+    def __init__(self):
+
+        self.ranges = []
+
+
+    def __contains__(self, value):
+
+        i = bisect_left(self.ranges, (value + 1,)) - 1
+        return i >= 0 and self.ranges[i][1] >= value
+
+
+    def add(self, first, last):
+        """Adds the range from ``first`` to ``last`` (inclusive)."""
+
+        ranges = []
+        for start, end in self.ranges:
+            if end < first - 1 or start > last + 1:
+                ranges.append((start, end))
+            else:
+                first = min(first, start)
+                last = max(last, end)
+        ranges.append((first, last))
+        ranges.sort()
+
+        self.ranges = ranges
+
+
+    def remove(self, first, last):
+        """Removes the range from ``first`` to ``last`` (inclusive)."""
+
+        ranges = []
+        for start, end in self.ranges:
+            if end < first or start > last:
+                ranges.append((start, end))
+                continue
+            if start < first:
+                ranges.append((start, first - 1))
+            if end > last:
+                ranges.append((last + 1, end))
+
+        self.ranges = ranges
+
+
+    def missing(self, first, last):
+        """
+        Returns the ranges between ``first`` and ``last`` which are not part
+        of this set.
+        """
+
+        missing = []
+        for start, end in self.ranges:
+            if end < first:
+                continue
+            if start > last:
+                break
+            if start > first:
+                missing.append((first, start - 1))
+            first = end + 1
+        if first <= last:
+            missing.append((first, last))
+
+        return missing
+
+
+class LRUCache(object):
+    """
+    A mapping holding at most ``size`` items. When it is full, the least
+    recently used item is dropped.
+    """
+
+    def __init__(self, size):
+
+        self.size = size
+        self._items = OrderedDict()
+
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __iter__(self):
+        return iter(self._items.keys())
+
+
+    def get(self, key, default=None):
+
+        if key not in self._items:
+            return default
+
+        value = self._items.pop(key)
+        self._items[key] = value
+        return value
+
+
+    def __setitem__(self, key, value):
+
+        self._items.pop(key, None)
+        self._items[key] = value
+
+        while len(self._items) > self.size:
+            self._items.popitem(last=False)
+
+
+    def pop(self, key, default=None):
+        return self._items.pop(key, default)
+
+
+    def clear(self):
+        self._items.clear()
 
 
 